@@ -0,0 +1,156 @@
+import time
+import asyncio
+import datetime
+from logger import logger
+
+from telegram.error import Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
+
+import config
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: rate токенов в секунду, запас burst"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (например, после RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        # lock выстраивает отправителей в очередь, поэтому токены выдаются по порядку
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    self.updated = time.monotonic()
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after_seconds(retry_after) -> float:
+    """RetryAfter.retry_after в секундах (PTB отдает int или timedelta)"""
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class BroadcastEngine:
+    """Рассылка копии сообщения пулом отправителей под общим лимитом скорости.
+
+    - общий TokenBucket (config.BROADCAST_RATE сообщений в секунду);
+    - config.BROADCAST_WORKERS одновременных отправителей;
+    - RetryAfter ставит на паузу всю рассылку и повторяет то же сообщение;
+    - сетевые ошибки повторяются с экспоненциальной задержкой
+      (не более config.BROADCAST_MAX_RETRIES раз).
+    """
+
+    OK, BLOCKED, ERROR = "ok", "blocked", "error"
+
+    def __init__(self, bot, from_chat_id, message_id):
+        self.bot = bot
+        self.from_chat_id = from_chat_id
+        self.message_id = message_id
+        self.bucket = TokenBucket(config.BROADCAST_RATE, burst=config.BROADCAST_WORKERS)
+
+        self.total = 0
+        self.done = 0
+        self.success = 0
+        self.blocked = 0
+        self.errors = 0
+        self.retries = 0
+        self.started_at = None
+
+    @property
+    def rate(self) -> float:
+        """Фактическая скорость, сообщений в секунду"""
+        if not self.started_at:
+            return 0.0
+        return self.done / max(time.monotonic() - self.started_at, 1e-6)
+
+    async def run(self, users, on_result=None):
+        """Рассылает сообщение всем users.
+        on_result(user_id, outcome, error) вызывается для каждого получателя."""
+        queue = asyncio.Queue()
+        for user_id in users:
+            queue.put_nowait((user_id, 0))
+        self.total += queue.qsize()
+        self.started_at = self.started_at or time.monotonic()
+
+        workers = [
+            asyncio.create_task(self._worker(queue, on_result))
+            for _ in range(config.BROADCAST_WORKERS)
+        ]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, queue: asyncio.Queue, on_result):
+        while True:
+            user_id, attempt = await queue.get()
+            try:
+                outcome, error = await self._send(user_id, attempt, queue)
+                if outcome is None:
+                    continue  # поставлено на повтор
+                self.done += 1
+                match outcome:
+                    case self.OK:
+                        self.success += 1
+                    case self.BLOCKED:
+                        self.blocked += 1
+                    case _:
+                        self.errors += 1
+                if on_result is not None:
+                    on_result(user_id, outcome, error)
+            finally:
+                queue.task_done()
+
+    async def _send(self, user_id, attempt, queue):
+        await self.bucket.acquire()
+        try:
+            await self.bot.copy_message(
+                chat_id=user_id,
+                from_chat_id=self.from_chat_id,
+                message_id=self.message_id
+            )
+            return self.OK, None
+        except Forbidden as e:
+            return self.BLOCKED, e
+        except BadRequest as e:
+            # например, чат не найден — повтор не поможет
+            return self.ERROR, e
+        except RetryAfter as e:
+            # флуд-лимит общий для бота — притормаживаем всех отправителей
+            delay = retry_after_seconds(e.retry_after)
+            logger.warning(f"Broadcast hit flood limit, pausing for {delay}s")
+            self.bucket.pause(delay)
+            self.retries += 1
+            queue.put_nowait((user_id, attempt))
+            return None, None
+        except (TimedOut, NetworkError) as e:
+            if attempt >= config.BROADCAST_MAX_RETRIES:
+                logger.error(f"Broadcast to {user_id} failed after {attempt} retries: {e}")
+                return self.ERROR, e
+            self.retries += 1
+            await asyncio.sleep(2 ** attempt)
+            queue.put_nowait((user_id, attempt + 1))
+            return None, None
+        except Exception as e:
+            logger.error(f"Error broadcast to {user_id}: {e}")
+            return self.ERROR, e
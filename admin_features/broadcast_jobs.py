@@ -0,0 +1,243 @@
+import json
+import time
+import asyncio
+import datetime
+from pathlib import Path
+from logger import logger
+
+import config
+import stats_manager
+from admin_features.broadcast import BroadcastEngine
+
+_jobs_dir_default = Path("data/broadcasts")
+
+# Выполняющиеся рассылки: id -> (job, engine), для метрик
+running: dict[str, tuple] = {}
+# фоновые задачи рассылок (см. start_broadcast_task)
+_tasks: set[asyncio.Task] = set()
+
+
+class BroadcastJob:
+    """Рассылка, сохраненная на диск, чтобы пережить перезапуск бота.
+
+    data/broadcasts/<id>.json      — параметры, статус, курсор и итоги
+    data/broadcasts/<id>.audience  — снимок аудитории, по id на строку
+    data/broadcasts/<id>.log       — итог по каждому получателю: "<id>\\t<outcome>"
+
+    Итоги дописываются пачками по config.BROADCAST_CHECKPOINT_EVERY.
+    При возобновлении получатели с записанным итогом пропускаются.
+    """
+
+    def __init__(self, job_id: str, jobs_dir: Path = _jobs_dir_default):
+        self.id = job_id
+        self.dir = jobs_dir
+        self.meta: dict = {}
+        self.audience: list[str] = []
+        self.outcomes: dict[str, str] = {}
+        self._pending: list[str] = []
+        self._log = None
+
+    @property
+    def meta_path(self):
+        return self.dir / f"{self.id}.json"
+
+    @property
+    def audience_path(self):
+        return self.dir / f"{self.id}.audience"
+
+    @property
+    def log_path(self):
+        return self.dir / f"{self.id}.log"
+
+    # ----------------------------------------------------------------------
+    # создание / загрузка
+    # ----------------------------------------------------------------------
+
+    @classmethod
+    def create(cls, admin_chat_id, from_chat_id, message_id, audience,
+               segment: dict | None = None, jobs_dir: Path = _jobs_dir_default):
+        jobs_dir.mkdir(parents=True, exist_ok=True)
+        job = cls(f"{time.strftime('%Y%m%d-%H%M%S')}-{admin_chat_id}", jobs_dir)
+        job.audience = [str(uid) for uid in audience]
+        job.meta = {
+            "admin_chat_id": admin_chat_id,
+            "from_chat_id": from_chat_id,
+            "message_id": message_id,
+            "segment": segment,
+            "created_at": datetime.datetime.now().isoformat(),
+            "status": "running",
+            "total": len(job.audience),
+            "cursor": 0,
+            "success": 0,
+            "blocked": 0,
+            "errors": 0,
+        }
+        job.audience_path.write_text("\n".join(job.audience), encoding="utf-8")
+        job._write_meta()
+        return job
+
+    @classmethod
+    def load(cls, meta_path: Path):
+        job = cls(meta_path.stem, meta_path.parent)
+        job.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        job.audience = job.audience_path.read_text(encoding="utf-8").split()
+        if job.log_path.exists():
+            for line in job.log_path.read_text(encoding="utf-8").splitlines():
+                uid, _, outcome = line.partition("\t")
+                if outcome:  # недописанная строка при аварийном завершении
+                    job.outcomes[uid] = outcome
+        return job
+
+    @classmethod
+    def unfinished(cls, jobs_dir: Path = _jobs_dir_default):
+        """Рассылки, прерванные перезапуском"""
+        if not jobs_dir.exists():
+            return []
+        jobs = []
+        for meta_path in sorted(jobs_dir.glob("*.json")):
+            try:
+                job = cls.load(meta_path)
+            except Exception as e:
+                logger.error(f"Cannot load broadcast job {meta_path}: {e}")
+                continue
+            if job.meta.get("status") == "running":
+                jobs.append(job)
+        return jobs
+
+    # ----------------------------------------------------------------------
+    # прогресс
+    # ----------------------------------------------------------------------
+
+    def remaining(self):
+        """Получатели без записанного итога, в исходном порядке"""
+        return [uid for uid in self.audience if uid not in self.outcomes]
+
+    def record(self, user_id, outcome, error=None):
+        self.outcomes[str(user_id)] = outcome
+        self._pending.append(f"{user_id}\t{outcome}\n")
+        if len(self._pending) >= config.BROADCAST_CHECKPOINT_EVERY:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Сохраняет накопленные итоги и курсор"""
+        if self._pending:
+            if self._log is None:
+                self._log = self.log_path.open("a", encoding="utf-8")
+            self._log.write("".join(self._pending))
+            self._log.flush()
+            self._pending.clear()
+
+        # курсор — длина префикса аудитории, по которому все итоги известны
+        cursor = self.meta["cursor"]
+        while cursor < len(self.audience) and self.audience[cursor] in self.outcomes:
+            cursor += 1
+        self.meta["cursor"] = cursor
+        counts = {"ok": 0, "blocked": 0, "error": 0}
+        for outcome in self.outcomes.values():
+            counts[outcome] = counts.get(outcome, 0) + 1
+        self.meta["success"] = counts["ok"]
+        self.meta["blocked"] = counts["blocked"]
+        self.meta["errors"] = counts["error"]
+        self._write_meta()
+
+    def finish(self):
+        self.meta["status"] = "done"
+        self.meta["finished_at"] = datetime.datetime.now().isoformat()
+        self.checkpoint()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _write_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.meta_path)
+
+
+async def run_job(bot, job: BroadcastJob, resumed: bool = False):
+    """Выполняет (или продолжает) рассылку и отчитывается админу.
+    bot — бот пула массовых отправок (bot_data["bulk_bot"])"""
+    admin_chat_id = job.meta["admin_chat_id"]
+    users = job.remaining()
+
+    if resumed:
+        text = (f"🔁 Рассылка возобновлена после перезапуска: "
+                f"осталось {len(users)} из {job.meta['total']} пользователей...")
+    else:
+        text = f"🚀 Рассылка началась на {len(users)} пользователей..."
+    status_msg = await bot.send_message(chat_id=admin_chat_id, text=text)
+
+    def on_result(user_id, outcome, error):
+        job.record(user_id, outcome)
+        # заблокировавшие бота больше не попадут в рассылки
+        stats_manager.note_delivery(user_id, outcome, error)
+
+    engine = BroadcastEngine(bot, job.meta["from_chat_id"], job.meta["message_id"])
+    reporter = asyncio.create_task(_report_progress(status_msg, engine, job))
+    running[job.id] = (job, engine)
+    try:
+        await engine.run(users, on_result=on_result)
+    finally:
+        running.pop(job.id, None)
+        reporter.cancel()
+        job.checkpoint()
+    job.finish()
+    await stats_manager.flush_stats()
+
+    # Отчет админу
+    await bot.send_message(
+        chat_id=admin_chat_id,
+        text=(
+            f"🏁 *Рассылка завершена*\n\n"
+            f"✅ Успешно: {job.meta['success']}\n"
+            f"🚫 Бот заблокирован: {job.meta['blocked']}\n"
+            f"⚠️ Ошибки: {job.meta['errors']}"
+        ),
+        parse_mode="Markdown"
+    )
+
+async def _report_progress(status_msg, engine: BroadcastEngine, job: BroadcastJob, interval: float = 5):
+    """Периодически обновляет сообщение о ходе рассылки"""
+    last_done = -1
+    while True:
+        await asyncio.sleep(interval)
+        if engine.done == last_done:
+            continue
+        last_done = engine.done
+        done = len(job.outcomes)
+        try:
+            await status_msg.edit_text(
+                f"🚀 Процесс: {done}/{job.meta['total']} ({engine.rate:.1f} сообщ./сек)"
+            )
+        except Exception:
+            pass
+
+def resume_broadcasts(app):
+    """Продолжает рассылки, прерванные перезапуском. Вызывается при старте"""
+    for job in BroadcastJob.unfinished():
+        logger.info(f"Resuming broadcast {job.id}: {len(job.remaining())} recipients left")
+        start_broadcast_task(run_job(app.bot_data["bulk_bot"], job, resumed=True))
+
+def start_broadcast_task(coro):
+    """Запускает рассылку в фоне.
+
+    Не через Application.create_task: app.stop() ждет такие задачи
+    до конца, и рассылка на всю аудиторию не давала боту остановиться
+    до SIGKILL. Эти задачи прерывает stop_broadcasts()."""
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_task_done)
+    return task
+
+def _task_done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Broadcast task failed", exc_info=task.exception())
+
+async def stop_broadcasts():
+    """Прерывает идущие рассылки при остановке бота. Прогресс сохраняется
+    в run_job, задания остаются running и продолжатся при следующем старте"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -4,56 +4,59 @@ from telegram.ext import (
     CallbackQueryHandler, MessageHandler, filters   
 )
 
-from telegram.error import Forbidden, BadRequest
+from telegram.error import BadRequest
 
+import json
+import time
 import asyncio
+import datetime
 
 from admin_features.keyboards_adm import *
-from data_loader import load_data
+from admin_features.broadcast_jobs import BroadcastJob, run_job, start_broadcast_task
+from content import reload_content
 import config
 from keyboards import *
 from utils import *
 
 import stats_manager
+import render_cache
+import metrics
 
 # Состояния для ConversationHandler
-WAITING_FOR_CONTENT, PREVIEW_ACTION, CONFIRM_BROADCAST = range(3)
+WAITING_FOR_CONTENT, PREVIEW_ACTION, CONFIRM_BROADCAST, SELECT_AUDIENCE = range(4)
 
 async def reload_conf(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
     msg = update.callback_query.message
 
     if not config.is_admin(update.effective_user.id):
         return
     await msg.reply_text("Перезагрузка конфигурации...")
-    profiles = load_data("data/profiles.json")
-    messages = load_data("data/messages.json")
-    results  = load_data("data/results.json")
-    context.application.bot_data["profiles_data"] = profiles
-    context.application.bot_data["messages"] = messages
-    context.application.bot_data["results"] = results
+    try:
+        # файлы читаются в рабочем потоке, контент подменяется целиком
+        changes = await reload_content(context.application.bot_data)
+    except Exception as e:
+        await msg.reply_text(f"⚠️ Конфигурация не загружена, оставлена прежняя:\n{e}")
+        return
     await stats_manager.increment_counter("reloads")
-    await msg.reply_text("Конфигурация перезагружена.")
+    await msg.reply_text("Конфигурация перезагружена.\n\n" + "\n".join(changes))
 
 async def get_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
     msg = update.callback_query.message
 
     if not config.is_admin(update.effective_user.id):
         return
     await msg.reply_text("Текущая статистика использования бота")
 
-    stats = await stats_manager.get_stats()
-    counters = stats.get("counters", {})
-    profiles = stats.get("profiles", {})
-    users    = stats.get("users", {})
+    summary = await stats_manager.get_summary()
+    counters = summary["counters"]
 
     lines = []
     lines.append("*Cчетчики:*")
     for k, v in counters.items():
         match k:
             case "start":
-                lines.append(f"- Старт нажали: {v} раз(а), всего пользователей: {len(users)}")
+                lines.append(f"- Старт нажали: {v} раз(а), всего пользователей: {summary['users']}")
+                lines.append(f"- Недоступны для рассылки (блок/удалены): {summary['inactive']}")
                 continue
             case "callbacks":
                 lines.append(f"- Колбеков обработано: {v}")
@@ -66,24 +69,91 @@ async def get_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 continue
             case "start_origin":
                 lines.append(f"- Откуда:")
+                reach = summary["origin_reach"]
                 for origin, cnt in v.items():
-                    lines.append(f"    - {origin.replace('_', ' ')}: {cnt}")
+                    line = f"    - {origin.replace('_', ' ')}: {cnt}"
+                    if origin in reach:
+                        line += f" (охват ≈{reach[origin]})"
+                    lines.append(line)
                 continue
             case _:
                 lines.append(f"- {k.replace('_', ' ')}: {v}")
                 continue
-    if profiles:
+    cache_hits, cache_misses = render_cache.cache_stats()
+    lines.append(f"- Кэш экранов: попаданий {cache_hits}, промахов {cache_misses}")
+    queued, dropped, overflows = stats_manager.queue_stats()
+    lines.append(f"- Очередь статистики: {queued}, отброшено {dropped}, переполнений {overflows}")
+
+    if summary["top_profiles"]:
         lines.append("\n*Топ 5 профилей по просмотрам:*")
-        top_profiles = sorted(
-            [(data.get("title", id), data.get("views", 0)) for id, data in profiles.items()],
-            key=lambda x: x[1],
-            reverse=True
-        )[:5]
-        for title, views in top_profiles:
-            lines.append(f"- {title}: {views}")
+        for title, views, unique in summary["top_profiles"]:
+            lines.append(f"- {title}: {views} (уникальных {'≈' if config.STATS_UNIQUES != 'exact' else ''}{unique})")
+
+    lines.extend(await _usage_lines(context))
 
     await msg.reply_text("\n".join(lines), parse_mode="Markdown")
-    await msg.reply_document(document=open("data/stats.json", "rb"))
+    # выгрузка собирается из хранилища, а не читается с диска
+    stats = await stats_manager.get_stats()
+    payload = json.dumps(stats, ensure_ascii=False, indent=2).encode("utf-8")
+    await msg.reply_document(document=payload, filename="stats.json")
+
+async def _usage_lines(context):
+    """Нагрузка по часам и дням из срезов статистики"""
+    lines = ["\n*Нагрузка (по часам за 24 ч):*"]
+    this_hour = int(time.time()) // 3600
+    for name, title in (("start", "Новые пользователи"), ("callbacks", "Нажатия"), ("text_messages", "Сообщения")):
+        hourly = await stats_manager.get_counter_usage(name, "hour")
+        daily = await stats_manager.get_counter_usage(name, "day")
+        last_day = hourly[-24:]
+        peak = max(last_day)
+        line = f"- {title}: {sum(last_day)} за сутки, {sum(daily[-7:])} за неделю"
+        if peak:
+            peak_hour = this_hour - (len(last_day) - 1 - last_day.index(peak))
+            peak_at = datetime.datetime.fromtimestamp(peak_hour * 3600, MOSCOW_TZ)
+            line += f", пик {peak}/ч ({peak_at:%d.%m %H}:00)"
+        lines.append(line)
+        lines.append(f"  {sparkline(last_day)}")
+
+    catalog = context.application.bot_data["content"].catalog
+    trending = []
+    for p in catalog.profiles:
+        views = sum((await stats_manager.get_profile_usage(p["id"], "hour"))[-24:])
+        if views:
+            trending.append((views, p["name"]))
+    if trending:
+        lines.append("\n*Профили за сутки:*")
+        for views, name in sorted(trending, reverse=True)[:5]:
+            lines.append(f"- {name}: {views}")
+    return lines
+
+async def get_latency(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    msg = update.callback_query.message
+
+    if not config.is_admin(update.effective_user.id):
+        return
+
+    lines = ["⏱ Задержки обработчиков, мс (p50 / p95 / max)"]
+    lines.append("в скобках — среднее время в Telegram API и в статистике\n")
+    for name, t in sorted(metrics.handlers.items(), key=lambda item: -item[1].latency.count):
+        h = t.latency
+        if not h.count and not t.in_flight:
+            continue
+        line = (f"{name}: {h.count} шт., {h.quantile(0.5):g} / {h.quantile(0.95):g} / {h.max:.0f}"
+                f" (API {t.api_ms / max(h.count, 1):.0f}, stats {t.stats_ms / max(h.count, 1):.1f})")
+        if t.errors:
+            line += f", ошибок {t.errors}"
+        if t.in_flight:
+            line += f", сейчас {t.in_flight}"
+        lines.append(line)
+
+    for title, table in (("Telegram API", metrics.api), ("Статистика", metrics.stats)):
+        if not table:
+            continue
+        lines.append(f"\n{title}:")
+        for name, h in sorted(table.items(), key=lambda item: -item[1].count):
+            lines.append(f"{name}: {h.count} шт., {h.quantile(0.5):g} / {h.quantile(0.95):g} / {h.max:.0f}")
+
+    await msg.reply_text("\n".join(lines))
 
 async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Шаг 1: Просьба отправить контент"""
@@ -130,16 +200,39 @@ async def show_preview(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text(f"Ошибка копирования: {e}")
         return ConversationHandler.END
 
+    await update.effective_chat.send_message(
+        _preview_text(context),
+        reply_markup=_preview_keyboard()
+    )
+
+def _preview_keyboard():
     keyboard = [
         [InlineKeyboardButton("🚀 Перейти к рассылке", callback_data="go_to_send")],
+        [InlineKeyboardButton("🎯 Аудитория", callback_data="audience")],
         [InlineKeyboardButton("✏️ Изменить текст", callback_data="change_content")],
         [InlineKeyboardButton("❌ Отмена", callback_data="cancel")]
     ]
-    
-    await update.effective_chat.send_message(
-        "Что делаем с этим сообщением?",
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+    return InlineKeyboardMarkup(keyboard)
+
+def _preview_text(context):
+    return f"Что делаем с этим сообщением?\n\nАудитория: {_describe_segment(context)}"
+
+def _describe_segment(context):
+    """Человекочитаемое описание выбранного сегмента"""
+    segment = context.user_data.get("broadcast_segment") or {}
+    parts = []
+    if segment.get("profiles"):
+        catalog = context.application.bot_data["content"].catalog
+        names = []
+        for pid in segment["profiles"]:
+            profile, _ = catalog.profile(pid)
+            names.append(profile["name"] if profile else pid)
+        parts.append("смотрели " + ", ".join(names))
+    if segment.get("origin"):
+        parts.append(f"пришли из «{segment['origin']}»")
+    if segment.get("active_days"):
+        parts.append(f"активны за {segment['active_days']} дн.")
+    return "; ".join(parts) if parts else "все пользователи"
 
 async def preview_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Шаг 3: Обработка кнопок предпросмотра"""
@@ -148,7 +241,7 @@ async def preview_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
 
     if data == "go_to_send":
-        users = await stats_manager.get_users_id()
+        users = await stats_manager.get_audience(context.user_data.get("broadcast_segment"))
         users_count = len(users)
         
         await query.edit_message_text(
@@ -162,6 +255,13 @@ async def preview_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return CONFIRM_BROADCAST
 
+    elif data == "audience":
+        await query.edit_message_text(
+            f"🎯 Аудитория рассылки\n\nСейчас: {_describe_segment(context)}",
+            reply_markup=audience_keyboard(config.STATS_UNIQUES != "sketch")
+        )
+        return SELECT_AUDIENCE
+
     elif data == "change_content":
         await query.edit_message_text("Ок, отправьте новое сообщение:")
         return WAITING_FOR_CONTENT
@@ -172,6 +272,56 @@ async def preview_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.clear()
         return ConversationHandler.END
 
+async def audience_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор сегмента: условия объединяются через «и»"""
+    query = update.callback_query
+    await query.answer()
+    data = query.data
+    segment = context.user_data.setdefault("broadcast_segment", {})
+
+    if data == "aud_done":
+        await query.edit_message_text(_preview_text(context), reply_markup=_preview_keyboard())
+        return PREVIEW_ACTION
+
+    if data == "aud_all":
+        segment.clear()
+    elif data.startswith("aud_act:"):
+        days = int(data.removeprefix("aud_act:"))
+        segment["active_days"] = None if segment.get("active_days") == days else days
+    elif data == "aud_profiles" or data.startswith("aud_p:"):
+        selected = segment.setdefault("profiles", [])
+        if data.startswith("aud_p:"):
+            pid = data.removeprefix("aud_p:")
+            if pid in selected:
+                selected.remove(pid)
+            else:
+                selected.append(pid)
+        catalog = context.application.bot_data["content"].catalog
+        profiles = [(p["id"], p["name"]) for p in catalog.profiles]
+        await query.edit_message_reply_markup(audience_profiles_keyboard(profiles, selected))
+        return SELECT_AUDIENCE
+    elif data == "aud_origins" or data.startswith("aud_o:"):
+        if data == "aud_origins":
+            summary = await stats_manager.get_summary(top=0)
+            context.user_data["broadcast_origins"] = list(summary["counters"].get("start_origin", {}))
+        origins = context.user_data.get("broadcast_origins", [])
+        if data.startswith("aud_o:"):
+            i = int(data.removeprefix("aud_o:"))
+            if i < len(origins):
+                origin = origins[i]
+                segment["origin"] = None if segment.get("origin") == origin else origin
+        await query.edit_message_reply_markup(audience_origins_keyboard(origins, segment.get("origin")))
+        return SELECT_AUDIENCE
+
+    try:
+        await query.edit_message_text(
+            f"🎯 Аудитория рассылки\n\nСейчас: {_describe_segment(context)}",
+            reply_markup=audience_keyboard(config.STATS_UNIQUES != "sketch")
+        )
+    except BadRequest:
+        pass  # текст не изменился
+    return SELECT_AUDIENCE
+
 async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Шаг 4: Финальное подтверждение и рассылка"""
     query = update.callback_query
@@ -188,69 +338,23 @@ async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Запускаем фоновую задачу, чтобы не блокировать бота
         admin_chat_id = update.effective_user.id
-        context.application.create_task(run_broadcast_task(admin_chat_id, context))
+        start_broadcast_task(run_broadcast_task(admin_chat_id, context))
         
         return ConversationHandler.END
 
 async def run_broadcast_task(admin_chat_id, context: ContextTypes.DEFAULT_TYPE):
     """Функция самой рассылки (фоновая)"""
-    msg_id = context.user_data['broadcast_msg_id']
-    from_chat = context.user_data['broadcast_chat_id']
-    
-    users = await stats_manager.get_users_id()
-    users_count = len(users)
-    
-    success = 0
-    blocked = 0
-    errors = 0
+    msg_id = context.user_data.pop('broadcast_msg_id')
+    from_chat = context.user_data.pop('broadcast_chat_id')
+    segment = context.user_data.pop('broadcast_segment', None) or None
+    context.user_data.pop('broadcast_origins', None)
 
-    status_msg = await context.bot.send_message(
-        chat_id=admin_chat_id, 
-        text=f"🚀 Рассылка началась на {users_count} пользователей..."
-    )
+    # Пропускаем админа
+    users = [uid for uid in await stats_manager.get_audience(segment) if uid != str(admin_chat_id)]
 
-    for i, user_id in enumerate(users):
-        if user_id == admin_chat_id:
-            continue # Пропускаем админа
-        try:
-            await context.bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=from_chat,
-                message_id=msg_id
-            )
-            success += 1
-            await asyncio.sleep(0.1) # Лимит ~10 сообщений в сек (лимит 30)
-            
-        except Forbidden:
-            blocked += 1
-            # db.set_user_inactive(user_id)
-        except Exception as e:
-            errors += 1
-            print(f"Error broadcast to {user_id}: {e}")
-        
-        if i % 100 == 0 and i > 0:
-             try:
-                await context.bot.edit_message_text(
-                    chat_id=admin_chat_id,
-                    message_id=status_msg.message_id,
-                    text=f"🚀 Процесс: {i}/{users_count}"
-                )
-             except: pass
-
-    # Отчет админу
-    await context.bot.send_message(
-        chat_id=admin_chat_id,
-        text=(
-            f"🏁 *Рассылка завершена*\n\n"
-            f"✅ Успешно: {success}\n"
-            f"🚫 Бот заблокирован: {blocked}\n"
-            f"⚠️ Ошибки: {errors}"
-        ),
-        parse_mode="Markdown"
-    )
-    # Очищаем данные
-    context.user_data.pop('broadcast_msg_id', None)
-    context.user_data.pop('broadcast_chat_id', None)
+    # рассылка сохраняется на диск и продолжится после перезапуска бота
+    job = BroadcastJob.create(admin_chat_id, from_chat, msg_id, users, segment=segment)
+    await run_job(context.bot_data["bulk_bot"], job)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Действие отменено.")
@@ -268,6 +372,9 @@ broadcast_handler = ConversationHandler(
         CONFIRM_BROADCAST: [
             CallbackQueryHandler(confirm_callback)
         ],
+        SELECT_AUDIENCE: [
+            CallbackQueryHandler(audience_callback, pattern="^aud_")
+        ],
     },
     fallbacks=[CommandHandler("cancel", cancel)]
 )
@@ -5,9 +5,42 @@ def admin_keyboard():
     buttons = [
         [InlineKeyboardButton("📊 Статистика", callback_data="stats"),
          InlineKeyboardButton("🔄️ Обновить конфиг", callback_data="reload")],
-        [InlineKeyboardButton("📢 Рассылка", callback_data="broadcast")],
+        [InlineKeyboardButton("📢 Рассылка", callback_data="broadcast"),
+         InlineKeyboardButton("⏱ Задержки", callback_data="latency")],
         [InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")]
     ]
     return InlineKeyboardMarkup(buttons)
 
 
+
+def audience_keyboard(by_profiles: bool = True):
+    """Меню выбора сегмента аудитории рассылки (by_profiles — доступен ли
+    сегмент по просмотренным профилям)"""
+    buttons = [[InlineKeyboardButton("👥 Все пользователи", callback_data="aud_all")]]
+    if by_profiles:
+        buttons.append([InlineKeyboardButton("📚 По просмотренным профилям", callback_data="aud_profiles")])
+    buttons += [
+        [InlineKeyboardButton("🔗 По источнику /start", callback_data="aud_origins")],
+        [InlineKeyboardButton("🕒 Активны 7 дней", callback_data="aud_act:7"),
+         InlineKeyboardButton("🕒 Активны 30 дней", callback_data="aud_act:30")],
+        [InlineKeyboardButton("✔️ Готово", callback_data="aud_done")]
+    ]
+    return InlineKeyboardMarkup(buttons)
+
+def audience_profiles_keyboard(profiles, selected):
+    """Переключатели профилей: profiles — список (id, название)"""
+    buttons = [
+        [InlineKeyboardButton(f"{'✅' if pid in selected else '▫️'} {name}", callback_data=f"aud_p:{pid}")]
+        for pid, name in profiles
+    ]
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="aud_menu")])
+    return InlineKeyboardMarkup(buttons)
+
+def audience_origins_keyboard(origins, selected):
+    """Выбор источника; в callback_data — индекс, чтобы уложиться в 64 байта"""
+    buttons = [
+        [InlineKeyboardButton(f"{'✅' if origin == selected else '▫️'} {origin}", callback_data=f"aud_o:{i}")]
+        for i, origin in enumerate(origins)
+    ]
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="aud_menu")])
+    return InlineKeyboardMarkup(buttons)
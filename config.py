@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,5 +8,94 @@ TG_TOKEN = os.getenv("TG_BOT_TOKEN")
 ADMINS = os.getenv("ADMINS", "")
 LOG_CHAT = os.getenv("LOG_CHAT", "")
 
+# Логи: ротация по размеру (size) или по времени (time), старые файлы сжимаются
+LOG_ROTATE = os.getenv("LOG_ROTATE", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")   # для LOG_ROTATE=time
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+# Выборка строк о каждом нажатии: доля записей уровня LOG_SAMPLE_LEVEL и ниже
+# из модулей LOG_SAMPLE_MODULES, которая попадет в лог (1 — все)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_SAMPLE_LEVEL = os.getenv("LOG_SAMPLE_LEVEL", "INFO")
+LOG_SAMPLE_MODULES = os.getenv("LOG_SAMPLE_MODULES", "handlers")
+
+# Статистика: хранилище (json | sqlite) и как часто сохранять данные на диск
+STATS_BACKEND = os.getenv("STATS_BACKEND", "json")
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "30"))   # секунды
+# json: размер журнала, после которого снимок пишется, не дожидаясь таймера
+STATS_JOURNAL_MAX_BYTES = int(os.getenv("STATS_JOURNAL_MAX_BYTES", str(4 * 1024 * 1024)))
+# Ожидаемое число пользователей для фильтра Блума известных пользователей
+# (0 — точное множество в памяти)
+STATS_KNOWN_USERS_BLOOM = int(os.getenv("STATS_KNOWN_USERS_BLOOM", "0"))
+# Уникальные пользователи профилей и источников: exact | both | sketch
+# (см. stats_storage/base.py; sketch — HyperLogLog вместо множеств id)
+STATS_UNIQUES = os.getenv("STATS_UNIQUES", "exact")
+# Очередь событий статистики между обработчиками и фоновой записью:
+# размер очереди и максимальная пачка, применяемая к хранилищу за раз
+STATS_QUEUE_SIZE = int(os.getenv("STATS_QUEUE_SIZE", "10000"))
+STATS_BATCH_SIZE = int(os.getenv("STATS_BATCH_SIZE", "200"))
+
+# Рассылка: общий лимит скорости (у Telegram ~30 сообщений/сек),
+# число одновременных отправителей и повторов при сетевых ошибках
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Как часто сохранять прогресс рассылки на диск (в получателях)
+BROADCAST_CHECKPOINT_EVERY = int(os.getenv("BROADCAST_CHECKPOINT_EVERY", "20"))
+
+# Пересылка сообщений пользователей в LOG_CHAT: скорость (сообщений/сек),
+# размер очереди и интервал дайджеста в секундах (0 — пересылать каждое)
+LOG_FORWARD_RATE = float(os.getenv("LOG_FORWARD_RATE", "1"))
+LOG_FORWARD_QUEUE = int(os.getenv("LOG_FORWARD_QUEUE", "500"))
+LOG_DIGEST_INTERVAL = float(os.getenv("LOG_DIGEST_INTERVAL", "0"))
+
+# HTTP-пулы Telegram API. Интерактивные ответы (меню, answer) и массовые
+# отправки (рассылка, пересылка в LOG_CHAT) идут через разные пулы соединений,
+# чтобы рассылка не занимала соединения, нужные пользователям.
+# Таймауты в секундах; pool_timeout — сколько ждать свободного соединения.
+TG_POOL_SIZE = int(os.getenv("TG_POOL_SIZE", "64"))
+TG_POOL_TIMEOUT = float(os.getenv("TG_POOL_TIMEOUT", "1"))
+TG_CONNECT_TIMEOUT = float(os.getenv("TG_CONNECT_TIMEOUT", "5"))
+TG_READ_TIMEOUT = float(os.getenv("TG_READ_TIMEOUT", "5"))
+TG_WRITE_TIMEOUT = float(os.getenv("TG_WRITE_TIMEOUT", "5"))
+# пул для массовых отправок: по умолчанию по соединению на отправителя рассылки
+BULK_POOL_SIZE = int(os.getenv("BULK_POOL_SIZE", str(BROADCAST_WORKERS + 2)))
+BULK_POOL_TIMEOUT = float(os.getenv("BULK_POOL_TIMEOUT", "30"))
+BULK_READ_TIMEOUT = float(os.getenv("BULK_READ_TIMEOUT", "10"))
+BULK_WRITE_TIMEOUT = float(os.getenv("BULK_WRITE_TIMEOUT", "10"))
+
+# Обработка апдейтов: сколько чатов обслуживается одновременно, отдельные
+# места для нажатий кнопок и сколько апдейтов можно взять из очереди
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+UPDATE_PRIORITY_WORKERS = int(os.getenv("UPDATE_PRIORITY_WORKERS", "8"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "256"))
+
+# Получение апдейтов: polling | webhook.
+# В режиме webhook бот слушает HTTP на WEBHOOK_LISTEN:WEBHOOK_PORT, а TLS
+# завершается на прокси/балансировщике с публичным адресом WEBHOOK_URL.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")            # https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# обязателен в режиме webhook: заголовок X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Файл для записи входящих апдейтов (JSONL) для scripts/replay_updates.py
+WEBHOOK_RECORD = os.getenv("WEBHOOK_RECORD", "")
+
+# Страница метрик для Prometheus (0 — выключена). Если порт совпадает
+# с WEBHOOK_PORT в режиме webhook, используется тот же HTTP-сервер.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+# Проверять изменения data/*.json раз в столько секунд и перезагружать
+# контент автоматически (0 — только вручную из админ-панели)
+CONTENT_WATCH_INTERVAL = float(os.getenv("CONTENT_WATCH_INTERVAL", "0"))
+
 def is_admin(user_id) -> bool:
     return str(user_id) in ADMINS
+
+def admin_ids() -> list[str]:
+    return re.findall(r"\d+", ADMINS)
@@ -0,0 +1,152 @@
+import os
+import asyncio
+from logger import logger
+
+import config
+import stats_manager
+from data_loader import Catalog, load_data
+from render_cache import RenderCache
+
+# Файлы контента бота
+CONTENT_FILES = {
+    "catalog": "data/profiles.json",
+    "messages": "data/messages.json",
+    "results": "data/results.json",
+}
+_REQUIRED_MESSAGES = ("welcome", "about", "results")
+
+_reload_lock = asyncio.Lock()
+
+
+class Content:
+    """Неизменяемый набор контента одной версии: каталог, тексты,
+    результаты и собранный по ним кэш экранов.
+
+    Хранится в bot_data["content"] и подменяется одним присваиванием,
+    поэтому обработчик, взявший content в начале, не увидит
+    новые профили вместе со старыми текстами.
+    """
+
+    __slots__ = ("version", "catalog", "messages", "results", "render", "mtimes")
+
+    def __init__(self, catalog, messages, results, mtimes=None):
+        set_ = object.__setattr__
+        set_(self, "version", catalog.version)
+        set_(self, "catalog", catalog)
+        set_(self, "messages", messages)
+        set_(self, "results", results)
+        set_(self, "render", RenderCache(catalog, messages, results))
+        set_(self, "mtimes", mtimes or {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Content is immutable")
+
+
+def file_mtimes(files=CONTENT_FILES):
+    return {key: os.stat(path).st_mtime_ns for key, path in files.items()}
+
+def load_content(files=CONTENT_FILES) -> Content:
+    """Читает и проверяет все файлы контента (синхронно — для рабочего потока)"""
+    # mtime до чтения: если файл поменяют во время загрузки, наблюдатель перечитает его еще раз
+    mtimes = file_mtimes(files)
+    data = {}
+    for key, path in files.items():
+        try:
+            data[key] = load_data(path)
+        except ValueError as e:
+            # в ошибке разбора JSON нет имени файла
+            raise ValueError(f"{path}: {e}") from e
+    catalog = Catalog(data["catalog"])
+    messages = data["messages"]
+    results = data["results"]
+
+    missing = [key for key in _REQUIRED_MESSAGES if key not in messages]
+    if missing:
+        raise ValueError(f"messages.json: missing keys {', '.join(missing)}")
+    if not isinstance(results, list):
+        raise ValueError("results.json: expected a list")
+    # RenderCache собирает все экраны — ошибки в полях профилей всплывут здесь
+    return Content(catalog, messages, results, mtimes)
+
+async def reload_content(bot_data) -> list[str]:
+    """Перечитывает контент в рабочем потоке и атомарно подменяет его.
+    Возвращает описание изменений. При ошибке старый контент остается."""
+    async with _reload_lock:
+        old = bot_data.get("content")
+        new = await asyncio.to_thread(load_content)
+        bot_data["content"] = new
+    logger.info(f"Content reloaded (version {new.version})")
+    return describe_changes(old, new)
+
+def describe_changes(old: Content | None, new: Content) -> list[str]:
+    """Что изменилось между версиями контента: профили, группы, тексты, результаты"""
+    if old is None:
+        return [f"Профилей: {len(new.catalog.profiles)}"]
+
+    old_profiles = {p["id"]: p for p in old.catalog.profiles}
+    new_profiles = {p["id"]: p for p in new.catalog.profiles}
+    added = [new_profiles[pid]["name"] for pid in new_profiles.keys() - old_profiles.keys()]
+    removed = [old_profiles[pid]["name"] for pid in old_profiles.keys() - new_profiles.keys()]
+    edited = [
+        new_profiles[pid]["name"]
+        for pid in new_profiles.keys() & old_profiles.keys()
+        if dict(new_profiles[pid]) != dict(old_profiles[pid])
+    ]
+
+    lines = []
+    if added:
+        lines.append("➕ Добавлены профили: " + ", ".join(sorted(added)))
+    if removed:
+        lines.append("➖ Удалены профили: " + ", ".join(sorted(removed)))
+    if edited:
+        lines.append("✏️ Изменены профили: " + ", ".join(sorted(edited)))
+
+    old_groups = [(g["id"], g["name"], g.get("description")) for g in old.catalog.groups]
+    new_groups = [(g["id"], g["name"], g.get("description")) for g in new.catalog.groups]
+    if old_groups != new_groups:
+        lines.append("✏️ Изменен список групп")
+
+    changed_messages = sorted(
+        key for key in old.messages.keys() | new.messages.keys()
+        if old.messages.get(key) != new.messages.get(key)
+    )
+    if changed_messages:
+        lines.append("✏️ Изменены тексты: " + ", ".join(changed_messages))
+    if old.results != new.results:
+        lines.append("✏️ Изменены результаты")
+
+    return lines or ["Изменений нет"]
+
+
+async def watch_content(app, interval: float):
+    """Фоновая задача: перечитывает контент, когда меняются mtime файлов,
+    и сообщает админам, что изменилось"""
+    failed_mtimes = None
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            mtimes = file_mtimes()
+        except OSError as e:
+            logger.warning(f"Cannot stat content files: {e}")
+            continue
+        if mtimes == app.bot_data["content"].mtimes or mtimes == failed_mtimes:
+            continue
+
+        try:
+            changes = await reload_content(app.bot_data)
+        except Exception as e:
+            # не повторяем, пока файл снова не изменится
+            failed_mtimes = mtimes
+            logger.error(f"Automatic content reload failed: {e}")
+            await _notify_admins(app.bot, f"⚠️ Файлы контента изменились, но не загружены:\n{e}")
+            continue
+        failed_mtimes = None
+        await stats_manager.increment_counter("reloads")
+        await _notify_admins(app.bot, "🔄 Контент обновлен автоматически.\n\n" + "\n".join(changes))
+
+async def _notify_admins(bot, text):
+    for admin_id in config.admin_ids():
+        try:
+            await bot.send_message(chat_id=admin_id, text=text)
+        except Exception as e:
+            logger.error(f"Cannot notify admin {admin_id}: {e}")
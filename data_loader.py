@@ -1,5 +1,7 @@
 import json
+import itertools
 from pathlib import Path
+from types import MappingProxyType
 
 def load_data(path: str):
     p = Path(path)
@@ -7,3 +9,61 @@ def load_data(path: str):
         raise FileNotFoundError(f"{path} not found")
     with p.open("r", encoding="utf-8") as f:
         return json.load(f)
+
+
+_catalog_versions = itertools.count(1)
+
+
+class Catalog:
+    """Неизменяемый индекс групп и профилей олимпиады.
+
+    Группы и профили — read-only словари (MappingProxyType), поэтому
+    шаблоны и клавиатуры работают с ними как раньше: profile["name"].
+    Поиск по id — O(1). Каждая загрузка получает новый номер version.
+    """
+
+    __slots__ = ("version", "groups", "profiles", "_groups_by_id", "_profiles_by_id", "_group_of")
+
+    def __init__(self, data: dict):
+        groups = []
+        profiles = []
+        groups_by_id = {}
+        profiles_by_id = {}
+        group_of = {}
+
+        for g in data["groups"]:
+            group_profiles = tuple(MappingProxyType(dict(p)) for p in g.get("profiles", []))
+            group = MappingProxyType({**g, "profiles": group_profiles})
+            if group["id"] in groups_by_id:
+                raise ValueError(f"Duplicate group id: {group['id']}")
+            groups.append(group)
+            groups_by_id[group["id"]] = group
+
+            for p in group_profiles:
+                if p["id"] in profiles_by_id:
+                    raise ValueError(f"Duplicate profile id: {p['id']}")
+                profiles.append(p)
+                profiles_by_id[p["id"]] = p
+                group_of[p["id"]] = group
+
+        set_ = object.__setattr__
+        set_(self, "version", next(_catalog_versions))
+        set_(self, "groups", tuple(groups))
+        set_(self, "profiles", tuple(profiles))
+        set_(self, "_groups_by_id", MappingProxyType(groups_by_id))
+        set_(self, "_profiles_by_id", MappingProxyType(profiles_by_id))
+        set_(self, "_group_of", MappingProxyType(group_of))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Catalog is immutable")
+
+    def group(self, gid):
+        """Группа по id или None"""
+        return self._groups_by_id.get(gid)
+
+    def profile(self, pid):
+        """(профиль, его группа) по id или (None, None)"""
+        profile = self._profiles_by_id.get(pid)
+        if profile is None:
+            return None, None
+        return profile, self._group_of[pid]
@@ -7,12 +7,19 @@ import config
 from keyboards import *
 from utils import *
 import stats_manager
+from render_cache import get_render_cache
+from router import CallbackRouter
 
 from admin_features.handlers_adm import *
 
 async def collect_ids(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user is None:
+        return
     user_id = update.effective_user.id
     user_tag = update.effective_user.username or "no_username"
+    # почти все апдейты от уже известных пользователей — выходим сразу
+    if stats_manager.is_known_user(user_id, user_tag):
+        return
     await stats_manager.collect_user_ids(user_id, user_tag)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -29,20 +36,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await stats_manager.increment_start(user_id, user_tag, start_parameter)
 
-    kb = [
-        [InlineKeyboardButton("🔍 Об олимпиаде", callback_data="about"),
-         InlineKeyboardButton("📊 Результаты", callback_data="results")],
-        [InlineKeyboardButton("🔥 Ближайшие даты", callback_data="close_dates"),
-        InlineKeyboardButton("✅ Выбрать профиль", callback_data="back_to_groups")]
-    ]
-
-    messages = context.application.bot_data.get("messages")
-    welcome_text = messages["welcome"]
-
-    if config.is_admin(update.effective_user.id):
-        welcome_text = "⚠️ Режим администратора активирован ⚠️" + "\n\n" + welcome_text
-        kb.append([InlineKeyboardButton("⚙️ Панель администратора", callback_data="admin_panel")])
-    keyboard = InlineKeyboardMarkup(kb)
+    render = get_render_cache(context.application.bot_data)
+    welcome_text, keyboard = render.main_menu(config.is_admin(update.effective_user.id))
 
     if update.message:
         await msg.reply_text(welcome_text, parse_mode="Markdown", reply_markup=keyboard)
@@ -50,27 +45,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await msg.edit_text(welcome_text, parse_mode="Markdown", reply_markup=keyboard)
 
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("✅ Выбрать профиль", callback_data="back_to_groups")],
-        [InlineKeyboardButton("🌐 Подробнее", url="https://priem.stankin.ru/stud_olymp/")],
-        [InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")]
-        
-    ])
+    keyboard = get_render_cache(context.application.bot_data).about_keyboard()
     #await update.callback_query.message.delete()
     logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) requested 'about' info.")
-    messages = context.application.bot_data.get("messages")
+    messages = context.application.bot_data["content"].messages
     about_text = messages.get("about", "Информация отсутствует.")
     await update.callback_query.edit_message_text(about_text, parse_mode="Markdown", reply_markup=keyboard)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if config.LOG_CHAT:
-        await context.bot.forward_message(
-            chat_id=config.LOG_CHAT,
-            from_chat_id=update.effective_chat.id,
-            message_id=update.message.message_id
-        )
-    
     logger.info(f"Received text message from @{update.effective_user.username} ({update.effective_user.id})")
 
     await stats_manager.increment_counter("text_messages")
@@ -82,108 +64,103 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text(random.choice(answers))
 
+    # пересылка в LOG_CHAT — в фоне, после ответа пользователю
+    forwarder = context.bot_data.get("log_forwarder")
+    if forwarder is not None:
+        forwarder.submit(update.message)
+
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Единая точка входа для всех кнопок меню (см. callback_router ниже)"""
     query = update.callback_query
     await query.answer()
-    data = context.application.bot_data.get("profiles_data")
-    cd = query.data
 
     await stats_manager.increment_counter("callbacks")
 
-    # назад к списку групп
-    if cd == "back_to_groups":
-        kb = build_groups_keyboard(data)
-        await query.edit_message_text("Для удобства мы разделили олимпиады по тематическим группам.\n\nВыбирай интересующую:", reply_markup=kb)
+    route = callback_router.resolve(query.data or "")
+    if route is None:
+        await query.edit_message_text("Непонятное действие.")
         return
+    await route(update, context)
+
+# назад к списку групп
+async def show_groups(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    kb = get_render_cache(context.application.bot_data).groups_keyboard()
+    await update.callback_query.edit_message_text("Для удобства мы разделили олимпиады по тематическим группам.\n\nВыбирай интересующую:", reply_markup=kb)
+
+# админ-панель
+async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logger.warning(f"Admin panel accessed by @{update.effective_user.username} ({update.effective_user.id})")
+    kb = admin_keyboard()
+    text = '⚠️ Режим администратора активирован ⚠️'
+    text += "\n\nЗдесь вы можете управлять ботом, просматривать статистику использования и выполнять рассылку пользователям."
+    await update.callback_query.edit_message_text(text, reply_markup=kb)
+
+# результаты олимпиад
+async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) requested 'results' info.")
+    content = context.application.bot_data["content"]
+    results_text = content.messages["results"]
+    render = content.render
+    kb = render.results_keyboard()
+    if render.has_results:
+        await query.edit_message_text(results_text, parse_mode="Markdown", reply_markup=kb)
+    else:
+        await query.edit_message_text("Результатов пока нет, но появятся в ближайшее время.\n\nМы тоже ждем 😔", reply_markup=kb)
 
-    # назад к главному меню
-    if cd == "back_to_home":
-        await start(update, context)
-        return
+# ближайшие даты олимпиад
+async def show_close_dates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) requested 'close_dates' info.")
+    text, kb = get_render_cache(context.application.bot_data).close_dates()
+    await update.callback_query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
 
-    # админ-панель
-    if cd == "admin_panel":
-        logger.warning(f"Admin panel accessed by @{update.effective_user.username} ({update.effective_user.id})")
-        kb = admin_keyboard()
-        text = '⚠️ Режим администратора активирован ⚠️'
-        text += "\n\nЗдесь вы можете управлять ботом, просматривать статистику использования и выполнять рассылку пользователям."
-        await query.edit_message_text(text, reply_markup=kb)
-        return
-    
-    # результаты олимпиад
-    if cd == "results":
-        logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) requested 'results' info.")
-        messages = context.application.bot_data.get("messages")
-        results_text = messages["results"]
-        data = context.application.bot_data.get("results", {})
-        kb = []
-        if data:
-            kb = build_results_keyboard(data)
-        kb.append([InlineKeyboardButton("🌐 Подробнее", url="https://priem.stankin.ru/stud_olymp/"),
-                   InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")
-        ])
-        if data:
-            await query.edit_message_text(results_text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(kb))
-        else:
-            await query.edit_message_text("Результатов пока нет, но появятся в ближайшее время.\n\nМы тоже ждем 😔", reply_markup=InlineKeyboardMarkup(kb))
+# выбор группы (group1..groupN)
+async def show_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    content = context.application.bot_data["content"]
+    group = content.catalog.group(query.data)
+    if not group:
+        await query.edit_message_text("Не найдена группа.")
         return
 
-    # ближайшие даты олимпиад
-    if cd == "close_dates":
-        logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) requested 'close_dates' info.")
-        top5_profiles = get_top5_profiles(data)
-        kb = build_top5_profiles_keyboard(top5_profiles)
+    logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) selected group {group['name']}.")
 
-        profiles_text = ""
-        for i, profile in enumerate(top5_profiles):
-            name = profile['name']
-            date = profile['date_olimp']
-            profiles_text += f"{i+1}. *{name}* — {date}\n"
-        text = f"Здесь собраны топ-5 ближайших олимпиад по разным направлениям.\n\n{profiles_text}\n\nВыбери интересующую: "
+    text, kb = content.render.group(group)
+    await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
 
-        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
-        return
-
-    # выбор группы (group1..groupN)
-    if cd.startswith("group"):
-        group = find_group_by_id(data, cd)
-        if not group:
-            await query.edit_message_text("Не найдена группа.")
-            return
-        
-        logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) selected group {group['name']}.")
-
-        kb = build_profiles_keyboard(group)
-        text = f"Группа *{group['name']}*.\n\n{group.get('description','')}\n\nТеперь выбери профиль:"
-        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
+# выбор профиля (p_*)
+async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    content = context.application.bot_data["content"]
+    profile, group = content.catalog.profile(query.data)
+    if not profile:
+        await query.edit_message_text("Профиль не найден.")
         return
 
-    # выбор профиля (p_*)
-    if cd.startswith("p_"):
-        profile, group = find_profile_by_id(data, cd)
-        if not profile:
-            await query.edit_message_text("Профиль не найден.")
-            return
-
-        logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) selected profile {profile['name']}.")
-        # increment profile view
-        user_id = update.effective_user.id
-
-        await stats_manager.increment_profile_view(
-            profile['id'],
-            profile['name'],
-            user_id
-        )
-        text = build_description(profile)
-
-        buttons = []
-        if profile.get("url"):
-            buttons.append([InlineKeyboardButton("✅ Регистрация", url=profile['url'])])
-        buttons.append([InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")])
-
-        kb = InlineKeyboardMarkup(buttons)
-
-        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
-        return
+    logger.info(f"User @{update.effective_user.username} ({update.effective_user.id}) selected profile {profile['name']}.")
+    # increment profile view
+    user_id = update.effective_user.id
 
-    await query.edit_message_text("Непонятное действие.")
\ No newline at end of file
+    await stats_manager.increment_profile_view(
+        profile['id'],
+        profile['name'],
+        user_id
+    )
+    text, kb = content.render.profile(profile)
+
+    await query.edit_message_text(text, parse_mode="Markdown", reply_markup=kb)
+
+
+# Маршруты кнопок. Новый экран — это новая строка здесь, а не ветка в if-цепочке
+callback_router = CallbackRouter()
+callback_router.exact("about", about)
+callback_router.exact("results", show_results)
+callback_router.exact("close_dates", show_close_dates)
+callback_router.exact("back_to_groups", show_groups)
+callback_router.exact("back_to_home", start)
+callback_router.exact("admin_panel", admin_panel)
+callback_router.exact("stats", get_statistics)
+callback_router.exact("reload", reload_conf)
+callback_router.exact("latency", get_latency)
+callback_router.prefix("group", show_group)
+callback_router.prefix("p_", show_profile)
@@ -0,0 +1,150 @@
+import asyncio
+from logger import logger
+
+# Минимальный HTTP/1.1 сервер на asyncio для вебхука Telegram и служебных
+# страниц. Без сторонних зависимостей (в PTB вебхук требует tornado).
+# Поддерживает keep-alive и Content-Length; chunked-запросы не принимаются.
+
+_MAX_HEADER = 16 * 1024
+_MAX_BODY = 1024 * 1024  # апдейт Telegram значительно меньше
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 411: "Length Required", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+class HttpServer:
+    """Обработчики регистрируются по (метод, путь) через route().
+    Обработчик — async def handler(request) -> (status, content_type, body: bytes)."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._routes = {}
+        self._server = None
+        self._clients = {}  # writer -> задача, обслуживающая соединение
+
+    def route(self, method: str, path: str, handler):
+        self._routes[(method, path)] = handler
+        return handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # соединения keep-alive сами не закрываются
+            tasks = list(self._clients.values())
+            for writer in list(self._clients):
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except _HttpError as e:
+                    await _respond(writer, e.status, "text/plain", e.status_text.encode(), keep_alive=False)
+                    return
+                if request is None:
+                    return  # клиент закрыл соединение
+
+                status, content_type, body = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                await _respond(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def _dispatch(self, request: Request):
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return 405, "text/plain", b"Method Not Allowed"
+            return 404, "text/plain", b"Not Found"
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"HTTP handler {request.method} {request.path} failed: {e}")
+            return 500, "text/plain", b"Internal Server Error"
+
+
+class _HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+        self.status_text = _REASONS.get(status, "Error")
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request | None:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise _HttpError(400)
+    except asyncio.LimitOverrunError:
+        raise _HttpError(413)
+    if len(head) > _MAX_HEADER:
+        raise _HttpError(413)
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise _HttpError(400)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding"):
+        raise _HttpError(411)
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise _HttpError(400)
+    if length < 0:
+        raise _HttpError(400)
+    if length > _MAX_BODY:
+        raise _HttpError(413)
+    body = await reader.readexactly(length) if length else b""
+
+    path, _, query = target.partition("?")
+    return Request(method.upper(), path, query, headers, body)
+
+
+async def _respond(writer: asyncio.StreamWriter, status, content_type, body: bytes, keep_alive: bool):
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
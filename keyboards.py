@@ -1,9 +1,9 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-def build_groups_keyboard(data):
+def build_groups_keyboard(catalog):
     """Возвращает InlineKeyboardMarkup для выбора группы"""
     buttons = []
-    for group in data["groups"]:
+    for group in catalog.groups:
         buttons.append([InlineKeyboardButton(group["name"], callback_data=group["id"])])
     # кнопка назад к главному меню
     buttons.append([InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")])
@@ -34,3 +34,39 @@ def build_results_keyboard(data):
     for result in data:
         buttons.append([InlineKeyboardButton(result["name"], url=result["url"])])
     return buttons
+
+def build_main_keyboard(is_admin=False):
+    """Возвращает InlineKeyboardMarkup главного меню"""
+    kb = [
+        [InlineKeyboardButton("🔍 Об олимпиаде", callback_data="about"),
+         InlineKeyboardButton("📊 Результаты", callback_data="results")],
+        [InlineKeyboardButton("🔥 Ближайшие даты", callback_data="close_dates"),
+        InlineKeyboardButton("✅ Выбрать профиль", callback_data="back_to_groups")]
+    ]
+    if is_admin:
+        kb.append([InlineKeyboardButton("⚙️ Панель администратора", callback_data="admin_panel")])
+    return InlineKeyboardMarkup(kb)
+
+def build_about_keyboard():
+    """Возвращает InlineKeyboardMarkup экрана 'Об олимпиаде'"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("✅ Выбрать профиль", callback_data="back_to_groups")],
+        [InlineKeyboardButton("🌐 Подробнее", url="https://priem.stankin.ru/stud_olymp/")],
+        [InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")]
+    ])
+
+def build_profile_keyboard(profile):
+    """Возвращает InlineKeyboardMarkup карточки профиля"""
+    buttons = []
+    if profile.get("url"):
+        buttons.append([InlineKeyboardButton("✅ Регистрация", url=profile['url'])])
+    buttons.append([InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")])
+    return InlineKeyboardMarkup(buttons)
+
+def build_results_screen_keyboard(results):
+    """Возвращает InlineKeyboardMarkup экрана результатов"""
+    kb = build_results_keyboard(results) if results else []
+    kb.append([InlineKeyboardButton("🌐 Подробнее", url="https://priem.stankin.ru/stud_olymp/"),
+               InlineKeyboardButton("🏠 Домой", callback_data="back_to_home")
+    ])
+    return InlineKeyboardMarkup(kb)
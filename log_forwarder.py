@@ -0,0 +1,127 @@
+import time
+import asyncio
+from logger import logger
+
+from telegram.error import RetryAfter
+
+import config
+from admin_features.broadcast import TokenBucket, retry_after_seconds
+
+_DIGEST_LIMIT = 4000  # длина одного сообщения-дайджеста (лимит Telegram — 4096)
+
+
+class LogForwarder:
+    """Фоновая пересылка сообщений пользователей в LOG_CHAT.
+
+    Обработчик только ставит сообщение в очередь (submit) и сразу отвечает
+    пользователю. Фоновая задача пересылает сообщения не быстрее
+    config.LOG_FORWARD_RATE в секунду, а при config.LOG_DIGEST_INTERVAL > 0
+    собирает их в один дайджест раз в LOG_DIGEST_INTERVAL секунд.
+    При переполнении очереди сообщения отбрасываются (см. dropped).
+    """
+
+    def __init__(self, bot, chat_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.digest_interval = config.LOG_DIGEST_INTERVAL
+        self.bucket = TokenBucket(config.LOG_FORWARD_RATE)
+        self.queue = asyncio.Queue(maxsize=config.LOG_FORWARD_QUEUE)
+        self.dropped = 0
+        self._task = None
+        # взяты из очереди, но еще не отправлены: stop() отправит их,
+        # если задачу отменят во время ожидания дайджеста или отправки
+        self._pending = []
+
+    def submit(self, message):
+        """Ставит сообщение в очередь на пересылку, не дожидаясь отправки"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Log forward queue is full, {self.dropped} messages dropped so far")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            loop = self._digest_loop() if self.digest_interval > 0 else self._forward_loop()
+            self._task = asyncio.create_task(loop)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # остаток отправляем дайджестом, чтобы не держать остановку бота
+        messages = self._pending + self._take_all()
+        self._pending = []
+        if messages:
+            await self._send_digest(messages)
+
+    # ----------------------------------------------------------------------
+    # режимы
+    # ----------------------------------------------------------------------
+
+    async def _forward_loop(self):
+        while True:
+            message = await self.queue.get()
+            self._pending = [message]
+            await self._call(
+                self.bot.forward_message,
+                chat_id=self.chat_id,
+                from_chat_id=message.chat_id,
+                message_id=message.message_id
+            )
+            self._pending = []
+
+    async def _digest_loop(self):
+        while True:
+            started = time.monotonic()
+            self._pending = [await self.queue.get()]
+            await asyncio.sleep(max(self.digest_interval - (time.monotonic() - started), 0))
+            self._pending.extend(self._take_all())
+            await self._send_digest(self._pending)
+            self._pending = []
+
+    def _take_all(self):
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return messages
+
+    async def _send_digest(self, messages):
+        chunk = f"📝 Сообщения пользователей ({len(messages)}):\n"
+        for message in messages:
+            line = _digest_line(message)
+            if len(chunk) + len(line) > _DIGEST_LIMIT:
+                await self._call(self.bot.send_message, chat_id=self.chat_id, text=chunk)
+                chunk = ""
+            chunk += line
+        if chunk:
+            await self._call(self.bot.send_message, chat_id=self.chat_id, text=chunk)
+
+    async def _call(self, method, **kwargs):
+        """Вызов API под лимитом скорости; при RetryAfter ждем и повторяем один раз"""
+        for _ in range(2):
+            await self.bucket.acquire()
+            try:
+                return await method(**kwargs)
+            except RetryAfter as e:
+                delay = retry_after_seconds(e.retry_after)
+                logger.warning(f"Log forwarding hit flood limit, pausing for {delay}s")
+                self.bucket.pause(delay)
+            except Exception as e:
+                logger.error(f"Failed to forward log message: {e}")
+                return None
+
+
+def _digest_line(message):
+    user = message.from_user
+    who = f"@{user.username}" if user and user.username else "без ника"
+    uid = user.id if user else message.chat_id
+    text = message.text or message.caption or "<медиа>"
+    if len(text) > 300:
+        text = text[:300] + "…"
+    return f"\n{who} ({uid}): {text}\n"
@@ -1,11 +1,49 @@
-import logging
 import os
+import gzip
+import queue
+import atexit
+import random
+import shutil
+import logging
+import logging.handlers
+
+import config
 
 
 # Create logs directory if it doesn't exist
 if not os.path.exists("logs"):
     os.makedirs("logs")
 
+# Обработчики ниже пишут в файлы из отдельного потока (QueueListener):
+# логгеры только кладут записи в очередь, поэтому запись на диск
+# не блокирует event loop. Файлы ротируются по размеру или по времени
+# (config.LOG_ROTATE), старые сегменты сжимаются gzip.
+
+# ==========================================================================
+# =======                     [ Rotation setup ]                     =======
+# ==========================================================================
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def _file_handler(path):
+    if config.LOG_ROTATE == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
 # ==========================================================================
 # =======                  [ Custom logging setup ]                  =======
 # ==========================================================================
@@ -14,8 +52,28 @@ logger = logging.getLogger("custom")
 logger.setLevel(logging.DEBUG)
 logger.propagate = False
 
+class NotTelegram(logging.Filter):
+    def filter(self, record):
+        return not record.name.startswith("telegram")
+
+class Sampling(logging.Filter):
+    """Пропускает только долю config.LOG_SAMPLE_RATE записей уровня
+    config.LOG_SAMPLE_LEVEL и ниже из модулей config.LOG_SAMPLE_MODULES
+    (строки о каждом нажатии). Предупреждения и ошибки не отбрасываются."""
+
+    def __init__(self):
+        super().__init__()
+        self.rate = config.LOG_SAMPLE_RATE
+        self.level = logging.getLevelName(config.LOG_SAMPLE_LEVEL)
+        self.modules = set(config.LOG_SAMPLE_MODULES.split(","))
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > self.level or record.module not in self.modules:
+            return True
+        return random.random() < self.rate
+
 # -------------------- Definition of debug handler -------------------------
-debug_handler = logging.FileHandler("logs/debug.log", encoding="utf-8")
+debug_handler = _file_handler("logs/debug.log")
 debug_handler.setLevel(logging.DEBUG)
 
 class OnlyDebug(logging.Filter):
@@ -23,6 +81,7 @@ class OnlyDebug(logging.Filter):
         return record.levelno == logging.DEBUG
 
 debug_handler.addFilter(OnlyDebug())
+debug_handler.addFilter(NotTelegram())
 
 debug_formatter = logging.Formatter(
     "%(asctime)s [%(levelname)s] %(message)s",
@@ -32,8 +91,9 @@ debug_handler.setFormatter(debug_formatter)
 # ------------------------- End of definition ------------------------------
 
 # --------------------- Definition of info handler -------------------------
-info_handler = logging.FileHandler("logs/info.log", encoding="utf-8")
+info_handler = _file_handler("logs/info.log")
 info_handler.setLevel(logging.INFO)
+info_handler.addFilter(NotTelegram())
 
 info_formatter = logging.Formatter(
     "%(asctime)s [%(levelname)s] %(message)s",
@@ -43,9 +103,6 @@ info_handler.setFormatter(info_formatter)
 
 # ------------------------- End of definition ------------------------------
 
-logger.addHandler(debug_handler)
-logger.addHandler(info_handler)
-
 
 # ==========================================================================
 # =======                 [ Telegram logging setup ]                 =======
@@ -62,8 +119,9 @@ tg_ext_logger.setLevel(logging.INFO)
 tg_ext_logger.propagate = False
 
 # ------------------------ Definition of tg handler ------------------------
-tg_handler = logging.FileHandler("logs/telegram.log", encoding="utf-8")
+tg_handler = _file_handler("logs/telegram.log")
 tg_handler.setLevel(logging.INFO)
+tg_handler.addFilter(logging.Filter("telegram"))
 
 tg_formatter = logging.Formatter(
     "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -72,9 +130,28 @@ tg_formatter = logging.Formatter(
 tg_handler.setFormatter(tg_formatter)
 # ------------------------- End of definition ------------------------------
 
-tg_logger.addHandler(tg_handler)
-tg_ext_logger.addHandler(tg_handler)
+
+# ==========================================================================
+# =======                      [ Queue setup ]                       =======
+# ==========================================================================
+
+_log_queue = queue.SimpleQueue()
+
+queue_handler = logging.handlers.QueueHandler(_log_queue)
+# выборка — до очереди, чтобы отброшенные записи ничего не стоили
+queue_handler.addFilter(Sampling())
+
+listener = logging.handlers.QueueListener(
+    _log_queue, debug_handler, info_handler, tg_handler, respect_handler_level=True
+)
+listener.start()
+# дописать оставшиеся в очереди записи при выходе
+atexit.register(listener.stop)
+
+logger.addHandler(queue_handler)
+tg_logger.addHandler(queue_handler)
+tg_ext_logger.addHandler(queue_handler)
 
 logger.info(   "<==                [ Logger initialized ]                ==>")
 logger.debug(  "<==                [ Logger initialized ]                ==>")
-tg_logger.info("<==                [ Logger initialized ]                ==>")
\ No newline at end of file
+tg_logger.info("<==                [ Logger initialized ]                ==>")
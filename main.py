@@ -1,6 +1,7 @@
 from logger import tg_logger
 import asyncio
-from telegram import Update
+import signal
+from telegram import Bot, Update
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -10,45 +11,151 @@ from telegram.ext import (
     filters,
 )
 import config
-from data_loader import load_data
+from content import load_content, watch_content
 import handlers, admin_features.handlers_adm
+from admin_features.broadcast_jobs import resume_broadcasts, stop_broadcasts
 import stats_manager
+from render_cache import advance_dates_daily
+from update_processor import ChatOrderedUpdateProcessor
+from log_forwarder import LogForwarder
+from http_server import HttpServer
+from webhook import setup_webhook, set_webhook
+import metrics
+from metrics import TimedHTTPXRequest
+from metrics_endpoint import setup_metrics
+
+def _build_bulk_bot():
+    """Отдельный бот со своим пулом соединений для рассылок и пересылки логов"""
+    request = TimedHTTPXRequest(
+        connection_pool_size=config.BULK_POOL_SIZE,
+        pool_timeout=config.BULK_POOL_TIMEOUT,
+        connect_timeout=config.TG_CONNECT_TIMEOUT,
+        read_timeout=config.BULK_READ_TIMEOUT,
+        write_timeout=config.BULK_WRITE_TIMEOUT,
+    )
+    return Bot(config.TG_TOKEN, request=request)
 
 async def _async_main():
     if not config.TG_TOKEN:
         tg_logger.error("TG_BOT_TOKEN is not set in env")
         return
+    if config.BOT_MODE == "webhook" and not config.WEBHOOK_URL:
+        tg_logger.error("BOT_MODE=webhook requires WEBHOOK_URL")
+        return
+    if config.BOT_MODE == "webhook" and not config.WEBHOOK_SECRET:
+        # без секрета кто угодно может прислать апдейт от имени админа
+        tg_logger.error("BOT_MODE=webhook requires WEBHOOK_SECRET")
+        return
 
-    profiles = load_data("data/profiles.json")
-    messages = load_data("data/messages.json")
-    results  = load_data("data/results.json")
+    content = load_content()
 
-    # ensure stats file exists
+    # ensure stats file exists and load it into memory
     await stats_manager.init_stats()
+    stats_manager.start_flusher()
 
-    app = Application.builder().token(config.TG_TOKEN).build()
-    app.bot_data["profiles_data"] = profiles
-    app.bot_data["messages"] = messages
-    app.bot_data["results"] = results
+    app = (
+        Application.builder()
+        .token(config.TG_TOKEN)
+        # вызовы Bot API замеряются (см. metrics); long polling — отдельным пулом без замеров
+        .request(TimedHTTPXRequest(
+            connection_pool_size=config.TG_POOL_SIZE,
+            pool_timeout=config.TG_POOL_TIMEOUT,
+            connect_timeout=config.TG_CONNECT_TIMEOUT,
+            read_timeout=config.TG_READ_TIMEOUT,
+            write_timeout=config.TG_WRITE_TIMEOUT,
+        ))
+        # апдейты разных чатов — параллельно, одного чата — по порядку
+        .concurrent_updates(ChatOrderedUpdateProcessor(
+            config.UPDATE_WORKERS,
+            config.UPDATE_PRIORITY_WORKERS,
+            config.UPDATE_MAX_PENDING,
+        ))
+        .build()
+    )
+    bulk_bot = _build_bulk_bot()
+    await bulk_bot.initialize()
+    app.bot_data["bulk_bot"] = bulk_bot
+    if config.LOG_CHAT:
+        # пересылка идет через пул массовых отправок
+        log_forwarder = LogForwarder(bulk_bot, config.LOG_CHAT)
+        app.bot_data["log_forwarder"] = log_forwarder
+    app.bot_data["content"] = content
 
     # handlers
     app.add_handler(TypeHandler(Update, handlers.collect_ids), group=2)
     app.add_handler(CommandHandler("start", handlers.start))
     #app.add_handler(CommandHandler("reload", handlers.reload_conf))
     #app.add_handler(CommandHandler("stats", handlers.get_statistics))
-    app.add_handler(CallbackQueryHandler(handlers.about, pattern="^about$"))
-    app.add_handler(CallbackQueryHandler(handlers.get_statistics, pattern="^stats$"))
-    app.add_handler(CallbackQueryHandler(handlers.reload_conf, pattern="^reload$"))
     app.add_handler(admin_features.handlers_adm.broadcast_handler)
+    # все остальные кнопки — через handlers.callback_router
     app.add_handler(CallbackQueryHandler(handlers.callback_handler))
     app.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, handlers.handle_text))
 
+    # задержки всех обработчиков и каждого маршрута кнопок
+    metrics.instrument_application(app)
+    handlers.callback_router.wrap(lambda name, handler: metrics.instrument(f"route:{name}", handler))
+
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    http_servers = []
+    if config.BOT_MODE == "webhook":
+        # апдейты приходят POST-запросами и кладутся в app.update_queue
+        webhook_server = HttpServer(config.WEBHOOK_LISTEN, config.WEBHOOK_PORT)
+        setup_webhook(app, webhook_server)
+        http_servers.append(webhook_server)
+    if config.METRICS_PORT:
+        if http_servers and config.METRICS_PORT == config.WEBHOOK_PORT:
+            metrics_server = http_servers[0]
+        else:
+            metrics_server = HttpServer(config.METRICS_LISTEN, config.METRICS_PORT)
+            http_servers.append(metrics_server)
+        setup_metrics(app, metrics_server, config.METRICS_PATH)
+    for server in http_servers:
+        await server.start()
+
+    if config.BOT_MODE == "webhook":
+        await set_webhook(app.bot)
+    else:
+        await app.updater.start_polling()
+    lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+    dates_task = asyncio.create_task(advance_dates_daily(app.bot_data))
+    if "log_forwarder" in app.bot_data:
+        app.bot_data["log_forwarder"].start()
+    watch_task = None
+    if config.CONTENT_WATCH_INTERVAL > 0:
+        watch_task = asyncio.create_task(watch_content(app, config.CONTENT_WATCH_INTERVAL))
+    resume_broadcasts(app)
+
+    # docker stop шлет SIGTERM — завершаемся штатно, чтобы сохранить статистику
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass  # Windows
 
     tg_logger.info("Bot started — waiting forever")
-    await asyncio.Event().wait()    
+    try:
+        await stop_event.wait()
+    finally:
+        tg_logger.info("Stopping bot...")
+        dates_task.cancel()
+        if watch_task is not None:
+            watch_task.cancel()
+        lag_task.cancel()
+        # до app.stop(): иначе он ждал бы окончания рассылок
+        await stop_broadcasts()
+        for server in http_servers:
+            await server.stop()
+        if app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        if "log_forwarder" in app.bot_data:
+            await app.bot_data["log_forwarder"].stop()
+        await bulk_bot.shutdown()
+        await stats_manager.shutdown_stats()
 
 
 def main():
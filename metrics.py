@@ -0,0 +1,186 @@
+import time
+import bisect
+import asyncio
+import functools
+import contextvars
+from itertools import chain
+
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+# Границы корзин гистограмм задержки, мс (последняя корзина — все, что больше)
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: O(log корзин) на замер"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля сверху — граница корзины, в которую он попал"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Timing:
+    """Задержки одного обработчика (или вызова API / хранилища)"""
+
+    __slots__ = ("latency", "errors", "in_flight", "api_ms", "stats_ms")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.in_flight = 0
+        self.api_ms = 0.0    # суммарное время в вызовах Telegram API
+        self.stats_ms = 0.0  # суммарное время в stats_manager
+
+
+updates: dict[str, int] = {}       # число апдейтов по типу
+handlers: dict[str, Timing] = {}   # обработчики и маршруты callback_router
+api: dict[str, Histogram] = {}     # методы Telegram API
+stats: dict[str, Histogram] = {}   # операции статистики
+
+loop_lag = Histogram()             # запаздывание event loop
+last_loop_lag_ms = 0.0
+
+# Счетчики [API, stats] текущего обработчика: вложенные обработчики
+# (маршрут внутри callback_handler) добавляют свое время и внешнему
+_current = contextvars.ContextVar("metrics_current", default=None)
+
+
+def _get(table, name, factory):
+    item = table.get(name)
+    if item is None:
+        item = table[name] = factory()
+    return item
+
+def _add_to_current(index: int, ms: float):
+    acc = _current.get()
+    if acc is not None:
+        acc[index] += ms
+
+
+def count_update(update):
+    kind = "other"
+    for attr in ("callback_query", "message", "edited_message", "my_chat_member"):
+        if getattr(update, attr, None) is not None:
+            kind = attr
+            break
+    updates[kind] = updates.get(kind, 0) + 1
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """Фоновая задача: насколько позже обещанного просыпается sleep(interval)"""
+    global last_loop_lag_ms
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        last_loop_lag_ms = max((time.perf_counter() - started - interval) * 1000, 0.0)
+        loop_lag.observe(last_loop_lag_ms)
+
+
+# ==========================================================================
+# =======                      [ Обработчики ]                       =======
+# ==========================================================================
+
+def instrument(name: str, func):
+    """Оборачивает async-обработчик: задержка, ошибки, число выполняющихся"""
+    timing = _get(handlers, name, Timing)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        acc = [0.0, 0.0]
+        token = _current.set(acc)
+        timing.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            timing.errors += 1
+            raise
+        finally:
+            timing.latency.observe((time.perf_counter() - started) * 1000)
+            timing.in_flight -= 1
+            timing.api_ms += acc[0]
+            timing.stats_ms += acc[1]
+            _current.reset(token)
+            outer = _current.get()
+            if outer is not None:
+                outer[0] += acc[0]
+                outer[1] += acc[1]
+
+    return wrapper
+
+def instrument_application(app):
+    """Оборачивает все зарегистрированные обработчики приложения
+    (включая шаги ConversationHandler)"""
+    for group in app.handlers.values():
+        for handler in group:
+            _instrument_handler(handler)
+
+def _instrument_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        for inner in chain(handler.entry_points, *handler.states.values(), handler.fallbacks):
+            _instrument_handler(inner)
+        return
+    name = getattr(handler.callback, "__name__", type(handler).__name__)
+    handler.callback = instrument(name, handler.callback)
+
+
+# ==========================================================================
+# =======                  [ Telegram API и stats ]                  =======
+# ==========================================================================
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest, который замеряет каждый вызов Bot API"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            _get(api, url.rsplit("/", 1)[-1], Histogram).observe(ms)
+            _add_to_current(0, ms)
+
+def observe_stats(name: str, ms: float):
+    _get(stats, name, Histogram).observe(ms)
+    _add_to_current(1, ms)
+
+def timed_stats(func):
+    """Декоратор для async-функций stats_manager"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            observe_stats(name, (time.perf_counter() - started) * 1000)
+
+    return wrapper
@@ -0,0 +1,113 @@
+import metrics
+import stats_manager
+import render_cache
+from admin_features import broadcast_jobs
+from http_server import HttpServer
+
+# Метрики в текстовом формате Prometheus (exposition format 0.0.4)
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def setup_metrics(app, server: HttpServer, path: str):
+    """Регистрирует на server страницу метрик для Prometheus"""
+
+    async def handle_metrics(request):
+        return 200, _CONTENT_TYPE, render(app).encode("utf-8")
+
+    server.route("GET", path, handle_metrics)
+
+
+def render(app) -> str:
+    out = []
+
+    _metric(out, "bot_updates_total", "counter", "Updates received, by type",
+            [({"type": kind}, n) for kind, n in metrics.updates.items()])
+    _metric(out, "bot_update_queue_depth", "gauge", "Updates waiting in the application queue",
+            [({}, app.update_queue.qsize())])
+    processor = app.update_processor
+    _metric(out, "bot_updates_in_progress", "gauge", "Updates taken from the queue and not finished",
+            [({}, processor.current_concurrent_updates)])
+
+    _histograms(out, "bot_handler_latency_seconds", "Handler latency", "handler",
+                {name: t.latency for name, t in metrics.handlers.items()})
+    _metric(out, "bot_handler_errors_total", "counter", "Handler exceptions",
+            [({"handler": name}, t.errors) for name, t in metrics.handlers.items()])
+    _metric(out, "bot_handler_in_flight", "gauge", "Handlers running right now",
+            [({"handler": name}, t.in_flight) for name, t in metrics.handlers.items()])
+    _metric(out, "bot_handler_api_seconds_total", "counter", "Time handlers spent in Telegram API calls",
+            [({"handler": name}, t.api_ms / 1000) for name, t in metrics.handlers.items()])
+    _metric(out, "bot_handler_stats_seconds_total", "counter", "Time handlers spent in stats calls",
+            [({"handler": name}, t.stats_ms / 1000) for name, t in metrics.handlers.items()])
+    _histograms(out, "bot_api_latency_seconds", "Telegram Bot API call latency", "method", metrics.api)
+    _histograms(out, "bot_stats_latency_seconds", "Stats operation latency", "op", metrics.stats)
+
+    queued, dropped, overflows = stats_manager.queue_stats()
+    _metric(out, "bot_stats_queue_depth", "gauge", "Stats events waiting to be written", [({}, queued)])
+    _metric(out, "bot_stats_dropped_total", "counter", "Stats events dropped on a full queue", [({}, dropped)])
+    _metric(out, "bot_stats_overflows_total", "counter", "Synchronous stats writes on a full queue",
+            [({}, overflows)])
+
+    hits, misses = render_cache.cache_stats()
+    _metric(out, "bot_render_cache_hits_total", "counter", "Render cache hits", [({}, hits)])
+    _metric(out, "bot_render_cache_misses_total", "counter", "Render cache misses", [({}, misses)])
+
+    forwarder = app.bot_data.get("log_forwarder")
+    if forwarder is not None:
+        _metric(out, "bot_log_forward_queue_depth", "gauge", "Messages waiting to be forwarded to LOG_CHAT",
+                [({}, forwarder.queue.qsize())])
+        _metric(out, "bot_log_forward_dropped_total", "counter", "Messages dropped on a full forward queue",
+                [({}, forwarder.dropped)])
+
+    jobs = list(broadcast_jobs.running.items())
+    _metric(out, "bot_broadcast_running", "gauge", "Broadcasts in progress", [({}, len(jobs))])
+    _metric(out, "bot_broadcast_recipients", "gauge", "Recipients of the broadcast",
+            [({"job": job_id}, job.meta["total"]) for job_id, (job, _) in jobs])
+    _metric(out, "bot_broadcast_done", "gauge", "Recipients with a recorded outcome",
+            [({"job": job_id}, len(job.outcomes)) for job_id, (job, _) in jobs])
+    _metric(out, "bot_broadcast_rate", "gauge", "Messages per second in this run",
+            [({"job": job_id}, engine.rate) for job_id, (_, engine) in jobs])
+    _metric(out, "bot_broadcast_outcomes", "gauge", "Outcomes in this run",
+            [({"job": job_id, "outcome": outcome}, getattr(engine, attr))
+             for job_id, (_, engine) in jobs
+             for outcome, attr in (("ok", "success"), ("blocked", "blocked"), ("error", "errors"))])
+
+    _metric(out, "bot_event_loop_lag_seconds", "gauge", "Last measured event loop lag",
+            [({}, metrics.last_loop_lag_ms / 1000)])
+    _histograms(out, "bot_event_loop_lag_distribution_seconds", "Event loop lag", None,
+                {None: metrics.loop_lag})
+
+    return "\n".join(out) + "\n"
+
+
+def _metric(out, name, kind, help_text, samples):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        out.append(f"{name}{_labels(labels)} {_number(value)}")
+
+def _histograms(out, name, help_text, label, table):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} histogram")
+    for key, hist in table.items():
+        labels = {label: key} if label else {}
+        cumulative = 0
+        for bound, n in zip(metrics.BUCKETS_MS, hist.counts):
+            cumulative += n
+            out.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound / 1000)})} {cumulative}")
+        out.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+        out.append(f"{name}_sum{_labels(labels)} {_number(hist.total / 1000)}")
+        out.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
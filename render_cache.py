@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+from logger import logger
+
+from keyboards import *
+from utils import *
+
+# Счетчики попаданий/промахов за все время работы (для админ-статистики)
+hits = 0
+misses = 0
+
+
+class RenderCache:
+    """Заранее собранные тексты и клавиатуры для текущей версии каталога.
+
+    Собирается целиком при загрузке/перезагрузке конфигурации как часть
+    content.Content. Если чего-то нет в кэше, экран собирается на лету
+    и запоминается.
+    """
+
+    def __init__(self, catalog, messages, results):
+        self.catalog = catalog
+        self.version = catalog.version
+
+        welcome = messages["welcome"]
+        self._welcome = {
+            False: welcome,
+            True: "⚠️ Режим администратора активирован ⚠️" + "\n\n" + welcome,
+        }
+        self._main_keyboard = {False: build_main_keyboard(False), True: build_main_keyboard(True)}
+        self._about_keyboard = build_about_keyboard()
+
+        self._groups_keyboard = build_groups_keyboard(catalog)
+        self._groups = {g["id"]: self._render_group(g) for g in catalog.groups}
+        self._profiles = {p["id"]: self._render_profile(p) for p in catalog.profiles}
+
+        self.upcoming = UpcomingProfiles(catalog.profiles)
+        self._close_dates = None
+
+        self.has_results = bool(results)
+        self._results_keyboard = build_results_screen_keyboard(results)
+
+    @staticmethod
+    def _render_group(group):
+        return build_group_text(group), build_profiles_keyboard(group)
+
+    @staticmethod
+    def _render_profile(profile):
+        return build_description(profile), build_profile_keyboard(profile)
+
+    @staticmethod
+    def _hit(item):
+        global hits
+        hits += 1
+        return item
+
+    def _lookup(self, table, key, obj, render):
+        global misses
+        item = table.get(key)
+        if item is not None:
+            return self._hit(item)
+        misses += 1
+        item = table[key] = render(obj)
+        return item
+
+    def main_menu(self, is_admin):
+        """(текст, клавиатура) главного меню"""
+        return self._hit((self._welcome[is_admin], self._main_keyboard[is_admin]))
+
+    def about_keyboard(self):
+        return self._hit(self._about_keyboard)
+
+    def groups_keyboard(self):
+        return self._hit(self._groups_keyboard)
+
+    def results_keyboard(self):
+        return self._hit(self._results_keyboard)
+
+    def close_dates(self):
+        """(текст, клавиатура) экрана ближайших олимпиад.
+        Пересобирается только когда сменился набор ближайших дат."""
+        global misses
+        if self.upcoming.advance() or self._close_dates is None:
+            misses += 1
+            top5_profiles = self.upcoming.next(5)
+            self._close_dates = (
+                build_close_dates_text(top5_profiles),
+                build_top5_profiles_keyboard(top5_profiles)
+            )
+            return self._close_dates
+        return self._hit(self._close_dates)
+
+    def group(self, group):
+        """(текст, клавиатура) экрана группы"""
+        return self._lookup(self._groups, group["id"], group, self._render_group)
+
+    def profile(self, profile):
+        """(текст, клавиатура) карточки профиля"""
+        return self._lookup(self._profiles, profile["id"], profile, self._render_profile)
+
+
+def get_render_cache(bot_data) -> RenderCache:
+    """Кэш экранов текущей версии контента"""
+    return bot_data["content"].render
+
+
+async def advance_dates_daily(bot_data):
+    """Фоновая задача: в полночь по Москве сдвигает индекс ближайших дат
+    и заранее пересобирает экран 'Ближайшие даты'"""
+    while True:
+        now = datetime.datetime.now(MOSCOW_TZ)
+        midnight = datetime.datetime.combine(
+            now.date() + datetime.timedelta(days=1), datetime.time(0, 0, 1), MOSCOW_TZ
+        )
+        await asyncio.sleep((midnight - now).total_seconds())
+        render = get_render_cache(bot_data)
+        render.close_dates()
+        logger.info(f"Upcoming dates advanced to {moscow_today()}")
+
+
+def cache_stats():
+    """(попадания, промахи) кэша отображения"""
+    return hits, misses
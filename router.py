@@ -0,0 +1,52 @@
+class CallbackRouter:
+    """Маршрутизация callback_data по таблице точных совпадений
+    и префиксному дереву (для семейств вида group1..groupN, p_*).
+
+    Поиск — O(длины callback_data): сначала точное совпадение,
+    затем самый длинный зарегистрированный префикс.
+    """
+
+    _END = ""  # ключ узла дерева, под которым лежит обработчик префикса
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+
+    def exact(self, data: str, handler):
+        """Обработчик для callback_data, равного data"""
+        self._exact[data] = handler
+        return handler
+
+    def prefix(self, prefix: str, handler):
+        """Обработчик для callback_data, начинающегося с prefix"""
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[self._END] = handler
+        return handler
+
+    def wrap(self, wrapper):
+        """Заменяет каждый обработчик на wrapper(имя, обработчик).
+        Имя — callback_data для точных совпадений и "prefix*" для префиксов."""
+        self._exact = {data: wrapper(data, h) for data, h in self._exact.items()}
+
+        def walk(node, path):
+            for ch, child in node.items():
+                if ch == self._END:
+                    node[ch] = wrapper(f"{path}*", child)
+                else:
+                    walk(child, path + ch)
+        walk(self._trie, "")
+
+    def resolve(self, data: str):
+        """Обработчик для callback_data или None"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler
+        node = self._trie
+        for ch in data:
+            node = node.get(ch)
+            if node is None:
+                break
+            handler = node.get(self._END, handler)
+        return handler
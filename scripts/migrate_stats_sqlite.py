@@ -0,0 +1,24 @@
+# Перенос статистики из data/stats.json (+ журнал) в data/stats.db.
+# Запуск из корня проекта: python scripts/migrate_stats_sqlite.py
+# Бот делает то же самое сам при первом старте с STATS_BACKEND=sqlite.
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stats_storage import SqliteStatsStorage
+
+
+async def main():
+    storage = SqliteStatsStorage()
+    if storage.path.exists():
+        print(f"{storage.path} already exists, remove it to migrate again")
+        return
+    await storage.open()
+    summary = storage.summary()
+    await storage.close()
+    print(f"Done: {summary['users']} users, counters: {summary['counters']}")
+
+
+asyncio.run(main())
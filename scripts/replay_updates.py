@@ -0,0 +1,92 @@
+# Отправляет записанные апдейты (JSONL, см. WEBHOOK_RECORD) на вебхук бота
+# и меряет время ответа эндпоинта.
+# Запуск из корня проекта:
+#   python scripts/replay_updates.py updates.jsonl --url http://127.0.0.1:8080/telegram
+# Бот ответит в чаты из записанных апдейтов — используйте тестовые аккаунты.
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+
+
+def load_updates(path: Path):
+    updates = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            updates.append(json.loads(line))
+    return updates
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+async def replay(updates, url, secret, concurrency, repeat):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+
+    queue = asyncio.Queue()
+    # каждому повтору — свои update_id, как у настоящих апдейтов
+    next_id = int(time.time() * 1000)
+    for _ in range(repeat):
+        for update in updates:
+            next_id += 1
+            queue.put_nowait({**update, "update_id": next_id})
+
+    latencies = []
+    statuses = {}
+
+    async def worker(client):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=update, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"Sent {len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"Statuses: {statuses}")
+    print(
+        f"Latency, ms: p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+        f"p99 {percentile(latencies, 99):.1f}  max {max(latencies, default=0):.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Telegram updates to the webhook")
+    parser.add_argument("file", type=Path, help="JSONL file with one update per line")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=config.WEBHOOK_SECRET)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = load_updates(args.file)
+    if not updates:
+        print(f"No updates in {args.file}")
+        return
+    asyncio.run(replay(updates, args.url, args.secret, args.concurrency, args.repeat))
+
+
+main()
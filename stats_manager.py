@@ -1,190 +1,378 @@
-import json
-import datetime
+import time
 import asyncio
-from pathlib import Path
 from logger import logger
 
-_stats_lock = asyncio.Lock()
-_stats_path_default = Path("data/stats.json")
+import config
+import metrics
+from stats_storage import StatsStorage, BloomFilter, create_storage, rollup
+
+# Статистика хранится в подключаемом хранилище (см. stats_storage):
+#   json   — данные в памяти, журнал событий и периодический снимок stats.json
+#   sqlite — таблицы в data/stats.db (WAL), точечные upsert'ы
+#
+# Каждое изменение описывается событием:
+#   {"t": unix_ts, "e": тип, ...поля события}
+# Типы событий:
+#   counter      — k: имя счетчика, n: приращение
+#   start        — u: user_id, n: @username, o: origin
+#   seen         — u: user_id (последняя активность, не чаще раза в сутки)
+#   profile_view — p: profile_id, n: title, u: user_id
+#   origin       — u: user_id, o: origin (повторный /start известного
+#                  пользователя по ссылке-источнику; только для скетчей охвата)
+#   user_seen    — u: user_id, n: @username
+#   delivery     — st: ok | blocked | deactivated, us: [user_id, ...]
+#                  (итоги рассылки; ok также обновляет last_success)
+#   user_active  — u: user_id (пользователь снова пишет боту)
+_storage: StatsStorage | None = None
+_dirty = 0                      # число событий с последнего сохранения
+_flush_event = asyncio.Event()  # будит фоновую задачу раньше таймера
+_flush_task: asyncio.Task | None = None
+
+# События не пишутся в хранилище из обработчиков: они кладутся в очередь,
+# а фоновая задача применяет их пачками. Если очередь переполнена,
+# необязательные события (счетчики, просмотры, seen) отбрасываются,
+# а остальные записываются сразу вместе со всей очередью, чтобы не нарушить порядок.
+_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+_DROPPABLE = {"counter", "profile_view", "seen", "origin"}
+# id новых пользователей, чье событие start еще в очереди: has_user()
+# их пока не видит, и повторный /start не должен считаться новым
+_pending_starts: set[str] = set()
+dropped = 0     # отброшено событий при переполнении очереди
+overflows = 0   # синхронных записей при переполнении очереди
+
+# Известные пары user_id + @username. Проверяются до обращения к хранилищу,
+# чтобы обработчик каждого апдейта (collect_ids) почти всегда ничего не делал.
+# Для очень большой аудитории вместо множества можно включить фильтр Блума:
+# редкий ложноположительный ответ лишь пропустит одно событие user_seen.
+_known_users: set[str] | BloomFilter = set()
+
+# Пользователи, которым не доставляются сообщения (заблокировали бота,
+# удалили аккаунт). Снова становятся активными при следующем апдейте.
+_inactive_users: set[str] = set()
+# Итоги рассылки копятся и пишутся одним событием на пачку
+_pending_deliveries: dict[str, list[str]] = {}
+_DELIVERY_BATCH = 50
+
+# Кто уже отмечен активным за текущие сутки (UTC) — событие seen
+# пишется не чаще раза в день на пользователя
+_seen_today: set[str] = set()
+_seen_day = 0
 
 
 async def init_stats():
-    logger.info("Initializing stats file...")
-    p = _stats_path_default
-    if not p.exists():
-        default = {
-            "meta": {
-                "created_at": datetime.datetime.now().isoformat(),
-                "last_updated": None
-            },
-            "counters": {
-                "start": 0,
-                "text_messages": 0,
-                "start_origin": {}, # { from_origin: count }
-                "callbacks": 0,
-                "reloads": 0
-            },
-            "users": {}, # user_id: { "username": username }
-
-            "profiles": {}
-            # profile: {
-            #     "title": title,
-            #     "users": [user_id1, user_id2],
-            #     "views": 0
-            # }
-        }
-        await _save(p, default)
-        logger.info("Stats file created.")
-    return p
-
-async def _load(p: Path):
-    def _read():
-        with p.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    return await asyncio.to_thread(_read)
-
-async def _save(p: Path, data: dict):
-    def _write():
-        tmp = p.with_suffix(".tmp")
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        tmp.replace(p)
-    await asyncio.to_thread(_write)
-
-async def get_stats():
-    p = _stats_path_default
-    if not p.exists():
+    """Открывает хранилище статистики, выбранное в config.STATS_BACKEND"""
+    global _storage
+    logger.info(f"Initializing stats storage ({config.STATS_BACKEND})...")
+    _storage = create_storage(config.STATS_BACKEND, config.STATS_UNIQUES, config.STATS_JOURNAL_MAX_BYTES)
+    await _storage.open()
+    _load_known_users()
+    _inactive_users.clear()
+    _inactive_users.update(_storage.inactive_users())
+    return _storage
+
+def _known_key(user_id: str, user_tag: str):
+    return f"{user_id}{user_tag}"
+
+def _load_known_users():
+    global _known_users
+    if config.STATS_KNOWN_USERS_BLOOM > 0:
+        _known_users = BloomFilter(config.STATS_KNOWN_USERS_BLOOM)
+    else:
+        _known_users = set()
+    for user_id, user_tag in _storage.iter_users():
+        if user_tag:
+            _known_users.add(_known_key(user_id, user_tag))
+
+def is_known_user(user_id: int, user_tag: str) -> bool:
+    """Быстрая проверка без обращения к хранилищу: True — делать ничего не нужно"""
+    if user_tag == "no_username":
+        return True
+    user_id = str(user_id)
+    if user_id in _inactive_users:
+        return False
+    if not _is_seen_today(user_id):
+        return False
+    return _known_key(user_id, f"@{user_tag}") in _known_users
+
+def _is_seen_today(user_id: str) -> bool:
+    global _seen_day
+    day = int(time.time()) // 86400
+    if day != _seen_day:
+        _seen_day = day
+        _seen_today.clear()
+    return user_id in _seen_today
+
+async def _get_storage():
+    if _storage is None:
         await init_stats()
-    return await _load(p)
+    return _storage
 
+def _record(kind: str, **fields):
+    global dropped, overflows
+    event = {"t": int(time.time()), "e": kind, **fields}
+    if _queue is None:
+        _apply_events([event])  # фоновая запись не запущена
+        return
+    try:
+        _queue.put_nowait(event)
+    except asyncio.QueueFull:
+        if kind in _DROPPABLE:
+            dropped += 1
+            if dropped % 1000 == 1:
+                logger.warning(f"Stats queue is full, {dropped} events dropped so far")
+            return
+        overflows += 1
+        _drain_queue()
+        _apply_events([event])
+
+def _apply_events(events: list[dict]):
+    global _dirty
+    try:
+        _storage.apply_many(events)
+    finally:
+        if _pending_starts:
+            for event in events:
+                if event["e"] == "start":
+                    _pending_starts.discard(event["u"])
+    _dirty += len(events)
+    if _storage.needs_flush():
+        _flush_event.set()
+
+def _drain_queue():
+    """Синхронно применяет все события из очереди"""
+    if _queue is None:
+        return
+    events = []
+    while not _queue.empty():
+        events.append(_queue.get_nowait())
+        _queue.task_done()
+    if events:
+        _apply_events(events)
+
+def queue_stats():
+    """(длина очереди, отброшено, синхронных записей при переполнении)"""
+    return (_queue.qsize() if _queue is not None else 0), dropped, overflows
+
+
+# ==========================================================================
+# =======                  [ Фоновое сохранение ]                    =======
+# ==========================================================================
+
+async def _writer_loop():
+    while True:
+        events = [await _queue.get()]
+        while len(events) < config.STATS_BATCH_SIZE and not _queue.empty():
+            events.append(_queue.get_nowait())
+        started = time.perf_counter()
+        try:
+            _apply_events(events)
+        except Exception as e:
+            logger.error(f"Failed to apply {len(events)} stats events: {e}")
+        finally:
+            metrics.observe_stats("apply_batch", (time.perf_counter() - started) * 1000)
+            for _ in events:
+                _queue.task_done()
+
+@metrics.timed_stats
+async def flush_stats():
+    """Надежно сохраняет накопленные изменения (снимок / checkpoint)"""
+    global _dirty
+    if _storage is not None:
+        _flush_deliveries()
+        _drain_queue()
+    if _storage is None or not _dirty:
+        return
+    pending = _dirty
+    _dirty = 0
+    try:
+        await _storage.flush()
+    except Exception:
+        _dirty += pending
+        raise
+    logger.debug(f"Stats flushed ({pending} events)")
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_event.wait(), timeout=config.STATS_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _flush_event.clear()
+        try:
+            await flush_stats()
+        except Exception as e:
+            logger.error(f"Failed to flush stats: {e}")
+
+def start_flusher():
+    """Запускает фоновые задачи записи событий и периодического сохранения"""
+    global _flush_task, _writer_task, _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=config.STATS_QUEUE_SIZE)
+    if _writer_task is None or _writer_task.done():
+        _writer_task = asyncio.create_task(_writer_loop())
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_loop())
+
+async def shutdown_stats():
+    """Останавливает фоновые задачи и закрывает хранилище"""
+    global _flush_task, _writer_task, _storage, _queue
+    for task in (_flush_task, _writer_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _flush_task = _writer_task = None
+    if _storage is not None:
+        _flush_deliveries()
+        _drain_queue()
+        await _storage.close()
+        _storage = None
+    _queue = None
+    logger.info("Stats saved on shutdown.")
+
+
+# ==========================================================================
+# =======                      [ Публичный API ]                     =======
+# ==========================================================================
+
+@metrics.timed_stats
+async def get_stats():
+    """Полный документ статистики в формате stats.json"""
+    storage = await _get_storage()
+    _drain_queue()
+    return storage.export()
+
+@metrics.timed_stats
+async def get_summary(top: int = 5):
+    """Сводка для админ-панели без выгрузки всех данных"""
+    storage = await _get_storage()
+    _drain_queue()
+    return storage.summary(top)
+
+@metrics.timed_stats
+async def get_counter_usage(name: str, unit: str = "hour"):
+    """Значения счетчика по часам/дням за окно буфера (от старых к новым)"""
+    storage = await _get_storage()
+    _drain_queue()
+    return storage.usage(rollup.counter_series(name), unit, int(time.time()))
+
+@metrics.timed_stats
+async def get_profile_usage(profile_id: str, unit: str = "hour"):
+    """Просмотры профиля по часам/дням за окно буфера"""
+    storage = await _get_storage()
+    _drain_queue()
+    return storage.usage(rollup.profile_series(profile_id), unit, int(time.time()))
+
+@metrics.timed_stats
 async def increment_counter(name: str, amount: int = 1):
     logger.debug(f"Incrementing counter '{name}' by {amount}")
-    p = _stats_path_default
-    async with _stats_lock:
-        stats = await get_stats()
-        stats["counters"].setdefault(name, 0)
-        stats["counters"][name] += amount
-        stats["meta"]["last_updated"] = datetime.datetime.now().isoformat()
-        await _save(p, stats)
+    await _get_storage()
+    _record("counter", k=name, n=amount)
 
+@metrics.timed_stats
 async def increment_start(user_id: int, user_tag: str, origin: str):
     if user_tag == "no_username":
         return
-    p = _stats_path_default
     user_tag = f'@{user_tag}'
     user_id = str(user_id)
 
-    async with _stats_lock:
-        stats = await get_stats()
-
-        # check if user not exists
-        users = stats.setdefault("users", {})
-        if user_id in users:
-            return  # user already counted, do not increment
-
-        print(user_id, user_tag, origin)
-        logger.info(f"New user: {user_id} ({user_tag}) from origin '{origin}'")
-        logger.debug(f"Incrementing start counter for user {user_id} ({user_tag})")
-        # save user info
-        users.setdefault(user_id, {})
-        users[user_id]["username"] = user_tag
-
-        # ===================================================
-        # ВРЕМЕННО
-        for k, v in users.items():
-            if v.get("username") == user_tag:
-                if k != user_id:
-                    del users[k]
-        # ВРЕМЕННО
-        # ===================================================
-
-        # save and increment origin
-        if origin is not None:
-            stats["counters"].setdefault("start_origin", {})
-            stats["counters"]["start_origin"].setdefault(origin, 0)
-            stats["counters"]["start_origin"][origin] += 1
-        
-        # increment start counter
-        stats["counters"].setdefault("start", 0)
-        stats["counters"]["start"] += 1
-        
-        stats["meta"]["last_updated"] = datetime.datetime.now().isoformat()
-        await _save(p, stats)
-
-async def increment_profile_view(profile_id: str, profile_title: str, user_id: int):
-    logger.debug(f"Incrementing profile view for profile '{profile_id}' by user {user_id}")
+    storage = await _get_storage()
 
-    p = _stats_path_default
-    user_id = str(user_id)
-    async with _stats_lock:
-        stats = await get_stats()
-
-        # ensure profile exists
-        if profile_id not in stats.get("profiles", {}):
-            stats.setdefault("profiles", {})
-            stats["profiles"].setdefault(profile_id, {})
-            stats["profiles"][profile_id]["title"] = profile_title
-
-        # total count
-        stats["profiles"][profile_id].setdefault("views", 0)
-        stats["profiles"][profile_id]["views"] += 1
-
-        # unique users
-        stats["profiles"][profile_id].setdefault("users", [])
+    # check if user not exists
+    if user_id in _pending_starts or storage.has_user(user_id):
+        # user already counted, do not increment; only origin reach
+        if origin is not None and config.STATS_UNIQUES != "exact":
+            _record("origin", u=user_id, o=origin)
+        return
 
-        if user_id not in stats["profiles"][profile_id]["users"]:
-            stats["profiles"][profile_id]["users"].append(user_id)
+    print(user_id, user_tag, origin)
+    logger.info(f"New user: {user_id} ({user_tag}) from origin '{origin}'")
+    logger.debug(f"Incrementing start counter for user {user_id} ({user_tag})")
+    _pending_starts.add(user_id)
+    _record("start", u=user_id, n=user_tag, o=origin)
+    _known_users.add(_known_key(user_id, user_tag))
+    _is_seen_today(user_id)
+    _seen_today.add(user_id)
 
-        stats["meta"]["last_updated"] = datetime.datetime.now().isoformat()
-        await _save(p, stats)
+@metrics.timed_stats
+async def increment_profile_view(profile_id: str, profile_title: str, user_id: int):
+    logger.debug(f"Incrementing profile view for profile '{profile_id}' by user {user_id}")
+    await _get_storage()
+    _record("profile_view", p=profile_id, n=profile_title, u=str(user_id))
 
+@metrics.timed_stats
 async def collect_user_ids(user_id: int, user_tag: str):
     if user_tag == "no_username":
         return
-    p = _stats_path_default
     user_id = str(user_id)
     user_tag = f'@{user_tag}'
 
-    async with _stats_lock:
-        stats = await get_stats()
+    storage = await _get_storage()
 
-        users = stats.setdefault("users", {})
-        if user_id in users:
-            return  # already exists
-        
+    if storage.get_username(user_id) != user_tag:
         logger.debug(f"Collecting user ID {user_id} ({user_tag})")
+        _record("user_seen", u=user_id, n=user_tag)
+    _known_users.add(_known_key(user_id, user_tag))
 
-        old_key = None
-        for k, v in users.items():
-            if v.get("username") == user_tag:
-                old_key = k
-                break
+    if not _is_seen_today(user_id) and storage.has_user(user_id):
+        _record("seen", u=user_id)
+        _seen_today.add(user_id)
 
-        if old_key:
-            # переносим данные
-            users[user_id] = users.pop(old_key)
-        else:
-            # новый юзер
-            # Вообще такого быть не должно, тк колбек обрабатывается после старта
-            print("Случилась фигня: новый юзер в collect_user_ids:", user_id, user_tag)
-            users[user_id] = {"username": user_tag}
-
-
-        # обновление профилей
-        for profile in stats.get("profiles", {}).values():
-            if old_key and old_key in profile.get("users", []):
-                profile["users"].remove(old_key)
-                if user_id not in profile["users"]:
-                    profile["users"].append(user_id)
-
-        stats["meta"]["last_updated"] = datetime.datetime.now().isoformat()
-
-        await _save(p, stats)
+    if user_id in _inactive_users:
+        # пользователь снова пишет боту — значит, доставка возможна
+        logger.info(f"User {user_id} ({user_tag}) is active again")
+        _flush_deliveries()
+        _inactive_users.discard(user_id)
+        _record("user_active", u=user_id)
 
 
+def note_delivery(user_id, outcome: str, error=None):
+    """Учитывает итог доставки рассылки пользователю (ok | blocked | error)"""
+    user_id = str(user_id)
+    match outcome:
+        case "ok":
+            state = "ok"
+            _inactive_users.discard(user_id)
+        case "blocked":
+            state = "deactivated" if "deactivated" in str(error).lower() else "blocked"
+            _inactive_users.add(user_id)
+        case _:
+            return  # временная ошибка не меняет состояние пользователя
+    batch = _pending_deliveries.setdefault(state, [])
+    batch.append(user_id)
+    if len(batch) >= _DELIVERY_BATCH:
+        _flush_deliveries()
+
+def _flush_deliveries():
+    for state, users in _pending_deliveries.items():
+        if users:
+            _record("delivery", st=state, us=users)
+    _pending_deliveries.clear()
+
+
+@metrics.timed_stats
 async def get_users_id():
-    async with _stats_lock:
-        stats = await get_stats()
-        users = stats.get("users", {}).keys()
-        filtered_users = filter(lambda uid: not uid.startswith("u"), users)
-        return list(filtered_users)
\ No newline at end of file
+    storage = await _get_storage()
+    _drain_queue()
+    return storage.get_users_id()
+
+@metrics.timed_stats
+async def get_audience(segment: dict | None = None):
+    """Получатели рассылки по сегменту:
+    {"profiles": [profile_id, ...], "origin": str, "active_days": int}.
+    Пустой сегмент — все доставляемые пользователи."""
+    storage = await _get_storage()
+    _drain_queue()
+    if not segment:
+        return storage.get_users_id()
+    active_since = None
+    if segment.get("active_days"):
+        active_since = int(time.time()) - segment["active_days"] * 86400
+    return storage.resolve_audience(
+        profiles=segment.get("profiles") or None,
+        origin=segment.get("origin"),
+        active_since=active_since,
+    )
@@ -0,0 +1,18 @@
+from stats_storage.base import StatsStorage, UNIQUES_MODES
+from stats_storage.bloom import BloomFilter
+from stats_storage.hll import HyperLogLog
+from stats_storage.json_storage import JsonStatsStorage
+from stats_storage.sqlite_storage import SqliteStatsStorage
+
+
+def create_storage(backend: str, uniques: str = "exact", journal_limit: int = 4 * 1024 * 1024) -> StatsStorage:
+    """Создает хранилище статистики по имени бэкенда из конфига"""
+    if uniques not in UNIQUES_MODES:
+        raise ValueError(f"Unknown uniques mode: {uniques}")
+    match backend:
+        case "json":
+            return JsonStatsStorage(uniques=uniques, journal_limit=journal_limit)
+        case "sqlite":
+            return SqliteStatsStorage(uniques=uniques)
+        case _:
+            raise ValueError(f"Unknown stats backend: {backend}")
@@ -0,0 +1,93 @@
+from abc import ABC, abstractmethod
+
+# Как считать уникальных пользователей профилей и источников /start:
+#   exact  — точные множества id (нужны для сегментов рассылки по профилям)
+#   both   — точные множества и скетчи HyperLogLog, охват берется из скетчей
+#   sketch — только скетчи: память и размер снимка не растут с аудиторией,
+#            но сегменты по профилям недоступны
+UNIQUES_MODES = ("exact", "both", "sketch")
+
+
+class StatsStorage(ABC):
+    """Хранилище статистики.
+
+    Все изменения приходят в виде событий (см. stats_manager) и
+    применяются синхронно методом apply(). Чтение идет через узкие
+    запросы, чтобы хранилище не было обязано держать все данные в памяти.
+    """
+
+    @abstractmethod
+    async def open(self):
+        """Подготавливает хранилище к работе (загрузка, миграции)"""
+
+    @abstractmethod
+    async def close(self):
+        """Сохраняет все изменения и освобождает ресурсы"""
+
+    @abstractmethod
+    def apply(self, event: dict):
+        """Применяет событие статистики"""
+
+    def apply_many(self, events: list[dict]):
+        """Применяет пачку событий (хранилища могут записать ее разом)"""
+        for event in events:
+            self.apply(event)
+
+    @abstractmethod
+    async def flush(self):
+        """Надежно сохраняет накопленные изменения"""
+
+    def needs_flush(self) -> bool:
+        """Стоит ли вызвать flush(), не дожидаясь таймера"""
+        return False
+
+    @abstractmethod
+    def has_user(self, user_id: str) -> bool:
+        """Известен ли пользователь"""
+
+    @abstractmethod
+    def get_username(self, user_id: str) -> str | None:
+        """@username пользователя или None, если он неизвестен"""
+
+    @abstractmethod
+    def iter_users(self):
+        """Пары (user_id, @username) всех известных пользователей"""
+
+    @abstractmethod
+    def inactive_users(self):
+        """id пользователей, которым сейчас нельзя доставить сообщение"""
+
+    @abstractmethod
+    def get_users_id(self) -> list[str]:
+        """id пользователей, которым можно отправить рассылку
+        (без заглушек u<N>, заблокировавших бота и удаленных аккаунтов)"""
+
+    @abstractmethod
+    def resolve_audience(self, profiles=None, origin=None, active_since=None) -> list[str]:
+        """Доставляемые пользователи из сегмента: смотрели любой из profiles,
+        пришли из origin, были активны начиная с active_since (unix_ts).
+        Не заданные условия не ограничивают выборку. Сегмент по профилям
+        в режиме uniques=sketch недоступен (ValueError)."""
+
+    def supports_profile_audience(self) -> bool:
+        """Хранятся ли точные зрители профилей (для сегментов рассылки)"""
+        return self.uniques != "sketch"
+
+    @abstractmethod
+    def usage(self, series: str, unit: str, now: int) -> list[int]:
+        """Значения ряда (см. rollup.py) по часам или дням (unit = hour | day)
+        за окно буфера, заканчивающееся интервалом с now; от старых к новым"""
+
+    @abstractmethod
+    def summary(self, top: int = 5) -> dict:
+        """Сводка для админ-панели:
+        { "counters": {...}, "users": count, "inactive": count,
+          "top_profiles": [(title, views, unique)],
+          "origin_reach": {origin: unique} }
+        unique — число уникальных зрителей (оценка по скетчу, если он ведется);
+        origin_reach — оценка охвата источников, пуст в режиме exact.
+        """
+
+    @abstractmethod
+    def export(self) -> dict:
+        """Полный документ статистики в формате stats.json"""
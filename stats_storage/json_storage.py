@@ -0,0 +1,610 @@
+import json
+import shutil
+import asyncio
+import datetime
+from pathlib import Path
+from logger import logger
+
+from stats_storage.base import StatsStorage
+from stats_storage.hll import HyperLogLog
+from stats_storage import rollup
+
+
+def default_stats():
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(),
+            "last_updated": None,
+            "journal_seq": 0
+        },
+        "counters": {
+            "start": 0,
+            "text_messages": 0,
+            "start_origin": {}, # { from_origin: count }
+            "callbacks": 0,
+            "reloads": 0
+        },
+        "users": {},
+        # user_id: {
+        #     "username": username,
+        #     "origin": start_origin,
+        #     "last_seen": ts,
+        #     "state": state,          # только для недоступных
+        #     "last_success": ts
+        # }
+
+        "profiles": {},
+        # profile: {
+        #     "title": title,
+        #     "users": [user_id1, user_id2],  # в памяти — set
+        #     "views": 0
+        # }
+
+        "rollups": {},
+        # hour | day: { series: { "<номер интервала>": value } }  — см. rollup.py
+
+        "sketches": {}
+        # profiles | origins: { key: HyperLogLog }  — на диске base64, только при uniques != exact
+    }
+
+
+def _user_sort_key(user_id: str):
+    # числовые id по возрастанию, заглушки u<N> — в конце
+    return (0, int(user_id), "") if user_id.isdigit() else (1, 0, user_id)
+
+
+def viewers_to_list(viewers) -> list[str]:
+    """Стабильная сериализация множества зрителей профиля"""
+    return sorted(viewers, key=_user_sort_key)
+
+
+def _to_json(value):
+    if isinstance(value, HyperLogLog):
+        return value.to_str()
+    return viewers_to_list(value)
+
+
+class JsonStatsStorage(StatsStorage):
+    """Статистика в памяти + журнал событий + периодический снимок stats.json.
+
+    Каждое событие дописывается одной строкой в журнал, flush() сворачивает
+    журнал в снимок. При открытии снимок загружается и журнал проигрывается.
+    Записи журнала получают порядковый номер "s", снимок хранит номер
+    последнего учтенного события в meta.journal_seq.
+
+    Уникальные зрители профилей в памяти хранятся множествами, на диск
+    пишутся отсортированным списком. Обратный индекс @username -> user_id
+    строится при загрузке и поддерживается при смене ника и слиянии записей.
+    Так же поддерживаются индексы для сегментов рассылки: origin -> users
+    и день последней активности -> users (профиль -> users — это сами
+    множества зрителей).
+
+    При uniques != exact уникальные зрители профилей и охват источников
+    дополнительно (или, при sketch, вместо множеств) считаются скетчами
+    HyperLogLog. Скетчи, которых еще нет, строятся по точным данным.
+    """
+
+    def __init__(self, path="data/stats.json", journal_path="data/stats.journal", uniques="exact",
+                 journal_limit=4 * 1024 * 1024):
+        self.path = Path(path)
+        self.journal_path = Path(journal_path)
+        self.uniques = uniques
+        # события и так надежно лежат в журнале, снимок — лишь его свертка:
+        # досрочно пишем его только когда журнал вырос до journal_limit байт
+        self.journal_limit = journal_limit
+        self._journal_bytes = 0
+        self.stats: dict | None = None
+        self._seq = 0
+        self._journal = None
+        self._by_username: dict[str, str] = {}
+        self._by_origin: dict[str, set[str]] = {}
+        self._by_day: dict[int, set[str]] = {}      # день (unix_ts // 86400) -> users
+        self._deliverable: list[str] | None = None  # кэш для get_users_id()
+        self._lock = asyncio.Lock()
+
+    @property
+    def _rotated_journal_path(self):
+        return self.journal_path.with_suffix(".journal.1")
+
+    # ----------------------------------------------------------------------
+    # открытие / сохранение
+    # ----------------------------------------------------------------------
+
+    async def open(self):
+        self.stats = await asyncio.to_thread(self.load)
+        if self._journal is None:
+            _end_line(self.journal_path)
+            self._journal = self.journal_path.open("a", encoding="utf-8")
+        self._journal_bytes = sum(
+            jp.stat().st_size for jp in (self._rotated_journal_path, self.journal_path) if jp.exists()
+        )
+
+    def _rotate_journal(self):
+        """Переносит журнал в .journal.1. Если тот остался от неудачного
+        снимка, журнал дописывается в его конец: события оттуда еще не
+        попали ни в один снимок"""
+        rotated = self._rotated_journal_path
+        if not self.journal_path.exists():
+            return
+        if not rotated.exists():
+            self.journal_path.replace(rotated)
+            return
+        _end_line(rotated)
+        with self.journal_path.open("rb") as src, rotated.open("ab") as dst:
+            shutil.copyfileobj(src, dst)
+        self.journal_path.unlink()
+
+    def load(self):
+        """Синхронно читает снимок и проигрывает журнал (без открытия на запись)"""
+        if not self.path.exists():
+            self.stats = default_stats()
+            self._write_snapshot(self._dump(self.stats))
+            logger.info("Stats file created.")
+        else:
+            with self.path.open("r", encoding="utf-8") as f:
+                self.stats = json.load(f)
+        for profile in self.stats.get("profiles", {}).values():
+            if "users" in profile:
+                profile["users"] = set(profile["users"])
+        self._index_users()
+        self._load_sketches()
+
+        self.stats["meta"].setdefault("journal_seq", 0)
+        self._seq = self.stats["meta"]["journal_seq"]
+
+        # журнал после ротации (если упали во время снимка) и текущий журнал
+        replayed = 0
+        for jp in (self._rotated_journal_path, self.journal_path):
+            replayed += self._replay(jp)
+        if replayed:
+            logger.info(f"Replayed {replayed} stats events from journal.")
+        return self.stats
+
+    def _replay(self, jp: Path):
+        if not jp.exists():
+            return 0
+        applied = 0
+        with jp.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # недописанная строка при аварийном завершении
+                    logger.warning(f"Skipping broken journal line in {jp}: {line[:80]}")
+                    continue
+                if event["s"] <= self._seq:
+                    continue  # уже учтено в снимке
+                self._apply(event)
+                self._seq = event["s"]
+                applied += 1
+        return applied
+
+    def _load_sketches(self):
+        stats = self.stats
+        if self.uniques == "exact":
+            # скетчи отстали бы от данных; при включении построятся заново
+            stats.pop("sketches", None)
+            return
+        sketches = stats.setdefault("sketches", {})
+        profiles = sketches.setdefault("profiles", {})
+        origins = sketches.setdefault("origins", {})
+        for kind in (profiles, origins):
+            for key, value in kind.items():
+                kind[key] = HyperLogLog.from_str(value)
+
+        for pid, profile in stats.get("profiles", {}).items():
+            if pid not in profiles:
+                profiles[pid] = _sketch_of(profile.get("users", ()))
+            if self.uniques == "sketch":
+                profile.pop("users", None)
+        for origin, users in self._by_origin.items():
+            if origin not in origins:
+                origins[origin] = _sketch_of(users)
+
+    @staticmethod
+    def _dump(data: dict):
+        # срезы — сотни мелких чисел на ряд, их пишем одной строкой без отступов
+        body = json.dumps(
+            {k: v for k, v in data.items() if k != "rollups"},
+            ensure_ascii=False, indent=2, default=_to_json
+        )
+        rollups = json.dumps(data.get("rollups", {}), separators=(",", ":"))
+        return f'{body[:-2]},\n  "rollups": {rollups}\n}}'
+
+    def _write_snapshot(self, payload: str):
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(payload)
+        tmp.replace(self.path)
+
+    async def flush(self):
+        async with self._lock:
+            if self.stats is None or self._seq == self.stats["meta"]["journal_seq"]:
+                return
+            # ротируем журнал синхронно: события, пришедшие во время записи
+            # снимка, попадут уже в новый файл
+            rotated = self._rotated_journal_path
+            if self._journal is not None:
+                self._journal.close()
+                self._rotate_journal()
+                self._journal = self.journal_path.open("a", encoding="utf-8")
+
+            # в цикле событий только дешево копируем изменяемые части
+            # (согласованный снимок), сериализация и запись — в потоке
+            prev_seq = self.stats["meta"]["journal_seq"]
+            self.stats["meta"]["journal_seq"] = self._seq
+            journal_bytes = self._journal_bytes
+            self._journal_bytes = 0
+            frozen = self._freeze()
+            try:
+                await asyncio.to_thread(lambda: self._write_snapshot(self._dump(frozen)))
+            except Exception:
+                self.stats["meta"]["journal_seq"] = prev_seq
+                self._journal_bytes += journal_bytes
+                raise
+            # снимок покрывает все события до self._seq, включая весь
+            # .journal.1 — он больше не нужен
+            rotated.unlink(missing_ok=True)
+
+    def needs_flush(self) -> bool:
+        return self._journal_bytes >= self.journal_limit
+
+    def _freeze(self) -> dict:
+        """Копия self.stats, которую события уже не изменят: копируются
+        словари и множества, строки и числа — общие"""
+        stats = self.stats
+        frozen = {
+            **stats,
+            "meta": dict(stats["meta"]),
+            "counters": {k: dict(v) if isinstance(v, dict) else v for k, v in stats["counters"].items()},
+            "users": {uid: dict(u) for uid, u in stats.get("users", {}).items()},
+            "profiles": {
+                pid: {**p, "users": set(p["users"])} if "users" in p else dict(p)
+                for pid, p in stats.get("profiles", {}).items()
+            },
+            "rollups": {
+                unit: {series: dict(ring) for series, ring in rings.items()}
+                for unit, rings in stats.get("rollups", {}).items()
+            },
+        }
+        if "sketches" in stats:
+            frozen["sketches"] = {
+                kind: {key: sketch.to_str() for key, sketch in items.items()}
+                for kind, items in stats["sketches"].items()
+            }
+        return frozen
+
+    async def close(self):
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # ----------------------------------------------------------------------
+    # запись
+    # ----------------------------------------------------------------------
+
+    def apply(self, event: dict):
+        self.apply_many([event])
+
+    def apply_many(self, events: list[dict]):
+        lines = []
+        for event in events:
+            self._seq += 1
+            event = {"s": self._seq, **event}
+            self._apply(event)
+            lines.append(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+        if self._journal is not None:
+            # пачка событий — одна запись в журнал
+            payload = "".join(lines)
+            self._journal.write(payload)
+            self._journal.flush()
+            self._journal_bytes += len(payload)
+
+    def _apply(self, event: dict):
+        stats = self.stats
+        match event["e"]:
+            case "counter":
+                stats["counters"].setdefault(event["k"], 0)
+                stats["counters"][event["k"]] += event["n"]
+                self._rollup(rollup.counter_series(event["k"]), event["t"], event["n"])
+            case "start":
+                self._apply_start(event["u"], event["n"], event.get("o"), event["t"])
+                self._deliverable = None
+            case "seen":
+                self._set_last_seen(event["u"], event["t"])
+            case "profile_view":
+                self._apply_profile_view(event["p"], event["n"], event["u"])
+                self._rollup(rollup.profile_series(event["p"]), event["t"])
+            case "origin":
+                self._sketch_add("origins", event["o"], event["u"])
+            case "user_seen":
+                self._apply_user_seen(event["u"], event["n"])
+                self._deliverable = None
+            case "delivery":
+                self._apply_delivery(event["st"], event["us"], event["t"])
+                self._deliverable = None
+            case "user_active":
+                self._apply_delivery("active", [event["u"]], None)
+                self._deliverable = None
+            case _:
+                logger.warning(f"Unknown stats event: {event}")
+                return
+        stats["meta"]["last_updated"] = datetime.datetime.fromtimestamp(event["t"]).isoformat()
+
+    def _apply_start(self, user_id, user_tag, origin, ts):
+        stats = self.stats
+        users = stats.setdefault("users", {})
+        if user_id in users:
+            return
+
+        # тот же @username у заглушки u<N> — переносим ее данные на настоящий id
+        old_key = self._by_username.get(user_tag)
+        if old_key is not None and old_key != user_id and old_key.startswith("u"):
+            self._merge_user(old_key, user_id)
+        else:
+            users[user_id] = {}
+        self._set_username(user_id, user_tag)
+        self._set_last_seen(user_id, ts)
+
+        # save and increment origin
+        if origin is not None:
+            users[user_id]["origin"] = origin
+            self._by_origin.setdefault(origin, set()).add(user_id)
+            stats["counters"].setdefault("start_origin", {})
+            stats["counters"]["start_origin"].setdefault(origin, 0)
+            stats["counters"]["start_origin"][origin] += 1
+            self._sketch_add("origins", origin, user_id)
+
+        # increment start counter
+        stats["counters"].setdefault("start", 0)
+        stats["counters"]["start"] += 1
+        self._rollup(rollup.counter_series("start"), ts)
+
+    def _rollup(self, series, ts, n=1):
+        rollup.add_event(self.stats.setdefault("rollups", {}), series, ts, n)
+
+    def _sketch_add(self, kind, key, user_id):
+        if self.uniques == "exact":
+            return
+        sketches = self.stats["sketches"][kind]
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog()
+        sketch.add(user_id)
+
+    def _apply_profile_view(self, profile_id, profile_title, user_id):
+        stats = self.stats
+        # ensure profile exists
+        if profile_id not in stats.get("profiles", {}):
+            stats.setdefault("profiles", {})
+            stats["profiles"].setdefault(profile_id, {})
+            stats["profiles"][profile_id]["title"] = profile_title
+
+        # total count
+        stats["profiles"][profile_id].setdefault("views", 0)
+        stats["profiles"][profile_id]["views"] += 1
+
+        # unique users
+        if self.uniques != "sketch":
+            stats["profiles"][profile_id].setdefault("users", set()).add(user_id)
+        self._sketch_add("profiles", profile_id, user_id)
+
+    def _apply_user_seen(self, user_id, user_tag):
+        users = self.stats.setdefault("users", {})
+        if user_id in users:
+            # пользователь сменил @username
+            if users[user_id].get("username") != user_tag:
+                self._set_username(user_id, user_tag)
+            return
+
+        old_key = self._by_username.get(user_tag)
+        if old_key is not None and old_key.startswith("u"):
+            # переносим данные заглушки
+            self._merge_user(old_key, user_id)
+        else:
+            # новый юзер
+            users[user_id] = {}
+        self._set_username(user_id, user_tag)
+
+    def _apply_delivery(self, state, user_ids, ts):
+        users = self.stats.setdefault("users", {})
+        for uid in user_ids:
+            user = users.get(uid)
+            if user is None:
+                continue
+            if state == "ok":
+                user.pop("state", None)
+                user["last_success"] = ts
+            elif state == "active":
+                user.pop("state", None)
+            else:
+                user["state"] = state
+
+    def _set_last_seen(self, user_id, ts):
+        user = self.stats["users"].get(user_id)
+        if user is None:
+            return
+        old = user.get("last_seen")
+        if old is not None:
+            self._by_day.get(old // 86400, set()).discard(user_id)
+        user["last_seen"] = ts
+        self._by_day.setdefault(ts // 86400, set()).add(user_id)
+
+    # ----------------------------------------------------------------------
+    # индексы пользователей
+    # ----------------------------------------------------------------------
+
+    def _index_users(self):
+        self._by_username = {}
+        self._by_origin = {}
+        self._by_day = {}
+        for uid, u in self.stats.get("users", {}).items():
+            self._index_user(uid, u)
+            tag = u.get("username")
+            if not tag:
+                continue
+            # при дублях предпочитаем настоящий id заглушке u<N>
+            current = self._by_username.get(tag)
+            if current is None or current.startswith("u"):
+                self._by_username[tag] = uid
+
+    def _index_user(self, user_id, user):
+        if user.get("origin") is not None:
+            self._by_origin.setdefault(user["origin"], set()).add(user_id)
+        if user.get("last_seen") is not None:
+            self._by_day.setdefault(user["last_seen"] // 86400, set()).add(user_id)
+
+    def _unindex_user(self, user_id, user):
+        if user.get("origin") is not None:
+            self._by_origin.get(user["origin"], set()).discard(user_id)
+        if user.get("last_seen") is not None:
+            self._by_day.get(user["last_seen"] // 86400, set()).discard(user_id)
+
+    def _set_username(self, user_id, user_tag):
+        user = self.stats["users"][user_id]
+        old_tag = user.get("username")
+        if old_tag and self._by_username.get(old_tag) == user_id:
+            del self._by_username[old_tag]
+        user["username"] = user_tag
+        other = self._by_username.get(user_tag)
+        if other is not None and other != user_id:
+            if other.startswith("u"):
+                # заглушка u<N> с этим @username — тот же человек, сливаем ее в текущую
+                other_user = self.stats["users"].pop(other, None)
+                if other_user:
+                    self._unindex_user(other, other_user)
+                self._move_views(other, user_id)
+            elif other in self.stats["users"]:
+                # у настоящего пользователя ник устарел: Telegram отдал
+                # освободившийся @username другому человеку
+                self.stats["users"][other].pop("username", None)
+        self._by_username[user_tag] = user_id
+
+    def _merge_user(self, old_key, user_id):
+        """Переносит запись пользователя и его просмотры профилей на новый id"""
+        users = self.stats["users"]
+        user = users.pop(old_key)
+        if self._by_username.get(user.get("username")) == old_key:
+            del self._by_username[user["username"]]
+        users[user_id] = user
+        self._unindex_user(old_key, user)
+        self._index_user(user_id, user)
+        self._move_views(old_key, user_id)
+
+    def _move_views(self, old_key, user_id):
+        for profile in self.stats.get("profiles", {}).values():
+            viewers = profile.get("users")
+            if viewers and old_key in viewers:
+                viewers.discard(old_key)
+                viewers.add(user_id)
+
+    # ----------------------------------------------------------------------
+    # чтение
+    # ----------------------------------------------------------------------
+
+    def has_user(self, user_id: str) -> bool:
+        return user_id in self.stats.get("users", {})
+
+    def get_username(self, user_id: str) -> str | None:
+        user = self.stats.get("users", {}).get(user_id)
+        return user.get("username") if user else None
+
+    def iter_users(self):
+        return ((uid, u.get("username")) for uid, u in self.stats.get("users", {}).items())
+
+    def inactive_users(self):
+        return [uid for uid, u in self.stats.get("users", {}).items() if "state" in u]
+
+    def get_users_id(self) -> list[str]:
+        if self._deliverable is None:
+            self._deliverable = [
+                uid for uid, u in self.stats.get("users", {}).items()
+                if not uid.startswith("u") and "state" not in u
+            ]
+        return list(self._deliverable)
+
+    def resolve_audience(self, profiles=None, origin=None, active_since=None) -> list[str]:
+        candidates = None
+
+        def narrow(ids):
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates & set(ids)
+
+        if profiles:
+            if not self.supports_profile_audience():
+                raise ValueError("Profile segments need exact viewer sets (uniques=exact|both)")
+            stats_profiles = self.stats.get("profiles", {})
+            narrow(set().union(*(stats_profiles.get(pid, {}).get("users", ()) for pid in profiles)))
+        if origin is not None:
+            narrow(self._by_origin.get(origin, ()))
+        if active_since is not None:
+            first_day = active_since // 86400
+            narrow(set().union(*(ids for day, ids in self._by_day.items() if day >= first_day)))
+
+        deliverable = self.get_users_id()
+        if candidates is None:
+            return deliverable
+        return [uid for uid in deliverable if uid in candidates]
+
+    def usage(self, series: str, unit: str, now: int) -> list[int]:
+        ring = self.stats.get("rollups", {}).get(unit, {}).get(series)
+        return rollup.ring_series(ring, unit, now)
+
+    def summary(self, top: int = 5) -> dict:
+        profiles = self.stats.get("profiles", {})
+        top_ids = sorted(profiles, key=lambda pid: profiles[pid].get("views", 0), reverse=True)[:top]
+        sketches = self.stats.get("sketches", {})
+        profile_sketches = sketches.get("profiles", {})
+
+        def unique(pid):
+            if pid in profile_sketches:
+                return profile_sketches[pid].count()
+            return len(profiles[pid].get("users", ()))
+
+        return {
+            "counters": self.stats.get("counters", {}),
+            "users": len(self.stats.get("users", {})),
+            "inactive": len(self.inactive_users()),
+            "top_profiles": [
+                (profiles[pid].get("title", pid), profiles[pid].get("views", 0), unique(pid))
+                for pid in top_ids
+            ],
+            "origin_reach": {origin: s.count() for origin, s in sketches.get("origins", {}).items()},
+        }
+
+    def export(self) -> dict:
+        profiles = {
+            pid: {**p, "users": viewers_to_list(p["users"])} if "users" in p else dict(p)
+            for pid, p in self.stats.get("profiles", {}).items()
+        }
+        document = {**self.stats, "profiles": profiles}
+        if "sketches" in self.stats:
+            document["sketches"] = {
+                kind: {key: sketch.to_str() for key, sketch in items.items()}
+                for kind, items in self.stats["sketches"].items()
+            }
+        return document
+
+
+def _sketch_of(user_ids) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for uid in user_ids:
+        sketch.add(uid)
+    return sketch
+
+
+def _end_line(path: Path):
+    """Завершает недописанную при аварии последнюю строку журнала:
+    иначе следующая запись допишется в нее и пропадет при проигрывании"""
+    if not path.exists():
+        return
+    with path.open("rb+") as f:
+        if f.seek(0, 2) == 0:
+            return
+        f.seek(-1, 2)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
@@ -0,0 +1,51 @@
+# Почасовые и посуточные срезы счетчиков и просмотров профилей.
+#
+# Каждый ряд (series) — окно из фиксированного числа последних интервалов,
+# хранятся только заполненные: {"<номер интервала>": значение, ...}
+# (номер интервала — unix_ts // ширина интервала; ключ — строка, как в JSON).
+# Событие попадает и в часовой, и в суточный ряд, поэтому старые часы
+# вытесняются, но остаются в суточных итогах (прореживание без
+# отдельного прохода). Память на ряд ограничена размером окна.
+#
+# Имена рядов: "counter:<имя счетчика>", "profile:<profile_id>".
+
+UNITS = {
+    "hour": (3600, 48),    # ширина интервала, число интервалов
+    "day": (86400, 90),
+}
+
+
+def counter_series(name: str) -> str:
+    return f"counter:{name}"
+
+def profile_series(profile_id: str) -> str:
+    return f"profile:{profile_id}"
+
+def ring_add(ring: dict, unit: str, ts: int, n: int = 1):
+    width, size = UNITS[unit]
+    slot = ts // width
+    key = str(slot)
+    if key in ring:
+        ring[key] += n
+        return
+    newest = max(map(int, ring), default=slot)
+    if slot <= newest - size:
+        return  # событие старше окна — не учитываем
+    ring[key] = n
+    # новый интервал вытесняет вышедшие из окна
+    for old in [k for k in ring if int(k) <= slot - size]:
+        del ring[old]
+
+def ring_series(ring: dict | None, unit: str, now: int) -> list[int]:
+    """Значения за все интервалы окна, от старого к текущему"""
+    width, size = UNITS[unit]
+    last = now // width
+    if not ring:
+        return [0] * size
+    return [ring.get(str(slot), 0) for slot in range(last - size + 1, last + 1)]
+
+def add_event(rollups: dict, series: str, ts: int, n: int = 1):
+    """Учитывает событие в часовом и суточном окнах ряда"""
+    for unit in UNITS:
+        rings = rollups.setdefault(unit, {})
+        ring_add(rings.setdefault(series, {}), unit, ts, n)
@@ -0,0 +1,586 @@
+import sqlite3
+import datetime
+from pathlib import Path
+from logger import logger
+
+from stats_storage.base import StatsStorage
+from stats_storage.json_storage import JsonStatsStorage
+from stats_storage.hll import HyperLogLog
+from stats_storage import rollup
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS origins (
+    origin TEXT PRIMARY KEY,
+    count  INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id      TEXT PRIMARY KEY,
+    username     TEXT,
+    state        TEXT,     -- NULL (активен) | blocked | deactivated
+    last_success INTEGER,  -- время последней успешной доставки рассылки
+    origin       TEXT,     -- start_origin при первом /start
+    last_seen    INTEGER   -- время последней активности (с точностью до дня)
+);
+CREATE INDEX IF NOT EXISTS users_username ON users(username);
+CREATE TABLE IF NOT EXISTS profiles (
+    profile_id TEXT PRIMARY KEY,
+    title      TEXT,
+    views      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS profiles_views ON profiles(views DESC);
+CREATE TABLE IF NOT EXISTS profile_views (
+    profile_id TEXT NOT NULL,
+    user_id    TEXT NOT NULL,
+    PRIMARY KEY (profile_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS profile_views_user ON profile_views(user_id);
+-- кольцевые буферы почасовых/посуточных срезов (см. rollup.py):
+-- строка — ячейка idx буфера ряда series, slot — номер интервала в ней
+CREATE TABLE IF NOT EXISTS rollups (
+    series TEXT    NOT NULL,
+    unit   TEXT    NOT NULL,
+    idx    INTEGER NOT NULL,
+    slot   INTEGER NOT NULL,
+    value  INTEGER NOT NULL,
+    PRIMARY KEY (series, unit, idx)
+) WITHOUT ROWID;
+-- скетчи HyperLogLog уникальных пользователей (kind = profiles | origins),
+-- только при uniques != exact
+CREATE TABLE IF NOT EXISTS sketches (
+    kind      TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    registers BLOB NOT NULL,  -- HyperLogLog.to_bytes()
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+"""
+
+# колонки, добавленные после первой версии схемы
+_USERS_COLUMNS = {
+    "state": "TEXT",
+    "last_success": "INTEGER",
+    "origin": "TEXT",
+    "last_seen": "INTEGER",
+}
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS users_inactive ON users(user_id) WHERE state IS NOT NULL;
+CREATE INDEX IF NOT EXISTS users_origin ON users(origin);
+CREATE INDEX IF NOT EXISTS users_last_seen ON users(last_seen);
+"""
+
+# порядок счетчиков в отчете такой же, как в stats.json
+_DEFAULT_COUNTERS = ("start", "text_messages", "callbacks", "reloads")
+
+
+class SqliteStatsStorage(StatsStorage):
+    """Статистика в SQLite (WAL): каждое событие — одна короткая транзакция
+    из точечных upsert'ов. При первом запуске данные переносятся из stats.json.
+
+    Скетчи уникальных пользователей (uniques != exact) держатся в памяти
+    и записываются в конце транзакции, только если изменились.
+    """
+
+    def __init__(self, path="data/stats.db", json_path="data/stats.json",
+                 journal_path="data/stats.journal", uniques="exact"):
+        self.path = Path(path)
+        self.json_path = Path(json_path)
+        self.journal_path = Path(journal_path)
+        self.uniques = uniques
+        self.db: sqlite3.Connection | None = None
+        self._sketches: dict[tuple[str, str], HyperLogLog] = {}
+        self._dirty_sketches: set[tuple[str, str]] = set()
+
+    # ----------------------------------------------------------------------
+    # открытие / сохранение
+    # ----------------------------------------------------------------------
+
+    async def open(self):
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+        self._migrate_schema()
+        self.db.executescript(_INDEXES)
+
+        if self._get_meta("created_at") is None:
+            # новая база: начальные данные и перенос stats.json — одна транзакция.
+            # Если перенос упадет, created_at не запишется и он повторится
+            # при следующем старте, а не останется пустая база
+            with self._tx():
+                self._set_meta("created_at", datetime.datetime.now().isoformat())
+                for name in _DEFAULT_COUNTERS:
+                    self.db.execute("INSERT OR IGNORE INTO counters(name, value) VALUES (?, 0)", (name,))
+                if self.json_path.exists():
+                    self.migrate_from_json()
+        self._load_sketches()
+
+    async def flush(self):
+        # изменения уже закоммичены, переносим WAL в основной файл
+        self.db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    async def close(self):
+        if self.db is not None:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.db.close()
+            self.db = None
+
+    def _migrate_schema(self):
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(users)")}
+        for name, decl in _USERS_COLUMNS.items():
+            if name not in columns:
+                self.db.execute(f"ALTER TABLE users ADD COLUMN {name} {decl}")
+
+    def _load_sketches(self):
+        db = self.db
+        if self.uniques == "exact":
+            # скетчи отстали бы от данных; при включении построятся заново
+            db.execute("DELETE FROM sketches")
+            return
+        self._sketches = {
+            (kind, key): HyperLogLog.from_bytes(registers)
+            for kind, key, registers in db.execute("SELECT kind, key, registers FROM sketches")
+        }
+        # недостающие скетчи строим по точным данным
+        sources = (
+            ("profiles", "SELECT profile_id FROM profiles", "SELECT user_id FROM profile_views WHERE profile_id = ?"),
+            ("origins", "SELECT origin FROM origins", "SELECT user_id FROM users WHERE origin = ?"),
+        )
+        for kind, keys_query, users_query in sources:
+            for (key,) in db.execute(keys_query).fetchall():
+                if (kind, key) in self._sketches:
+                    continue
+                sketch = self._sketches[(kind, key)] = HyperLogLog()
+                for (uid,) in db.execute(users_query, (key,)):
+                    sketch.add(uid)
+                self._dirty_sketches.add((kind, key))
+        with self._tx():
+            self._save_sketches()
+
+    def _tx(self):
+        return _Transaction(self.db)
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute(
+            "INSERT INTO meta(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    # ----------------------------------------------------------------------
+    # миграция из stats.json
+    # ----------------------------------------------------------------------
+
+    def migrate_from_json(self):
+        """Переносит данные из stats.json (вместе с непрожитым журналом).
+
+        Пользователи-заглушки u<N> из scripts/convert_stats.py переносятся
+        как есть и заменяются реальными id при первом их появлении в боте.
+        Вызывается внутри транзакции open().
+        """
+        logger.info(f"Migrating stats from {self.json_path} to {self.path}...")
+        source = JsonStatsStorage(self.json_path, self.journal_path, uniques=self.uniques)
+        stats = source.load()
+        db = self.db
+
+        meta = stats.get("meta", {})
+        if meta.get("created_at"):
+            self._set_meta("created_at", meta["created_at"])
+        if meta.get("last_updated"):
+            self._set_meta("last_updated", meta["last_updated"])
+
+        for name, value in stats.get("counters", {}).items():
+            if name == "start_origin":
+                db.executemany(
+                    "INSERT OR REPLACE INTO origins(origin, count) VALUES (?, ?)",
+                    value.items()
+                )
+                continue
+            db.execute("INSERT OR REPLACE INTO counters(name, value) VALUES (?, ?)", (name, value))
+
+        db.executemany(
+            "INSERT OR REPLACE INTO users(user_id, username, state, last_success, origin, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (uid, u.get("username"), u.get("state"), u.get("last_success"),
+                 u.get("origin"), u.get("last_seen"))
+                for uid, u in stats.get("users", {}).items()
+            )
+        )
+
+        for pid, p in stats.get("profiles", {}).items():
+            db.execute(
+                "INSERT OR REPLACE INTO profiles(profile_id, title, views) VALUES (?, ?, ?)",
+                (pid, p.get("title", pid), p.get("views", 0))
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO profile_views(profile_id, user_id) VALUES (?, ?)",
+                ((pid, uid) for uid in p.get("users", []))
+            )
+
+        db.executemany(
+            "INSERT OR REPLACE INTO sketches(kind, key, registers) VALUES (?, ?, ?)",
+            (
+                (kind, key, sketch.to_bytes())
+                for kind, items in stats.get("sketches", {}).items()
+                for key, sketch in items.items()
+            )
+        )
+
+        for unit, rings in stats.get("rollups", {}).items():
+            for series, ring in rings.items():
+                db.executemany(
+                    "INSERT OR REPLACE INTO rollups(series, unit, idx, slot, value) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (series, unit, int(slot) % rollup.UNITS[unit][1], int(slot), value)
+                        for slot, value in ring.items()
+                    )
+                )
+        logger.info(
+            f"Migrated {len(stats.get('users', {}))} users and "
+            f"{len(stats.get('profiles', {}))} profiles to SQLite."
+        )
+
+    # ----------------------------------------------------------------------
+    # запись
+    # ----------------------------------------------------------------------
+
+    def apply(self, event: dict):
+        with self._tx():
+            self._apply(event)
+            self._save_sketches()
+
+    def apply_many(self, events: list[dict]):
+        # пачка событий — одна транзакция вместо транзакции на событие
+        with self._tx():
+            for event in events:
+                self._apply(event)
+            self._save_sketches()
+
+    def _apply(self, event: dict):
+        match event["e"]:
+            case "counter":
+                self._inc_counter(event["k"], event["n"])
+                self._rollup(rollup.counter_series(event["k"]), event["t"], event["n"])
+            case "start":
+                self._apply_start(event["u"], event["n"], event.get("o"), event["t"])
+            case "seen":
+                self.db.execute("UPDATE users SET last_seen = ? WHERE user_id = ?", (event["t"], event["u"]))
+            case "profile_view":
+                self._apply_profile_view(event["p"], event["n"], event["u"])
+                self._rollup(rollup.profile_series(event["p"]), event["t"])
+            case "origin":
+                self._sketch_add("origins", event["o"], event["u"])
+            case "user_seen":
+                self._apply_user_seen(event["u"], event["n"])
+            case "delivery":
+                self._apply_delivery(event["st"], event["us"], event["t"])
+            case "user_active":
+                self.db.execute("UPDATE users SET state = NULL WHERE user_id = ?", (event["u"],))
+            case _:
+                logger.warning(f"Unknown stats event: {event}")
+                return
+        self._set_meta("last_updated", datetime.datetime.fromtimestamp(event["t"]).isoformat())
+
+    def _inc_counter(self, name, amount):
+        self.db.execute(
+            "INSERT INTO counters(name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def _apply_start(self, user_id, user_tag, origin, ts):
+        if self.has_user(user_id):
+            return  # user already counted
+
+        # тот же @username у заглушки u<N> — переносим ее данные на настоящий id
+        old_key = self._find_placeholder(user_tag)
+        if old_key is not None:
+            self._merge_user(old_key, user_id)
+        else:
+            self.db.execute("INSERT INTO users(user_id) VALUES (?)", (user_id,))
+        self._take_username(user_id, user_tag)
+        self.db.execute(
+            "UPDATE users SET origin = ?, last_seen = ? WHERE user_id = ?",
+            (origin, ts, user_id)
+        )
+
+        if origin is not None:
+            self.db.execute(
+                "INSERT INTO origins(origin, count) VALUES (?, 1) "
+                "ON CONFLICT(origin) DO UPDATE SET count = count + 1",
+                (origin,)
+            )
+            self._sketch_add("origins", origin, user_id)
+        self._inc_counter("start", 1)
+        self._rollup(rollup.counter_series("start"), ts)
+
+    def _rollup(self, series, ts, n=1):
+        # та же логика кольца, что в rollup.ring_add: в ячейке остается
+        # более новый интервал, для того же интервала значения складываются
+        for unit, (width, size) in rollup.UNITS.items():
+            slot = ts // width
+            self.db.execute(
+                "INSERT INTO rollups(series, unit, idx, slot, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(series, unit, idx) DO UPDATE SET "
+                "value = CASE WHEN slot = excluded.slot THEN value + excluded.value "
+                "             WHEN slot < excluded.slot THEN excluded.value ELSE value END, "
+                "slot = MAX(slot, excluded.slot)",
+                (series, unit, slot % size, slot, n)
+            )
+
+    def _apply_profile_view(self, profile_id, profile_title, user_id):
+        self.db.execute(
+            "INSERT INTO profiles(profile_id, title, views) VALUES (?, ?, 1) "
+            "ON CONFLICT(profile_id) DO UPDATE SET views = views + 1",
+            (profile_id, profile_title)
+        )
+        if self.uniques != "sketch":
+            self.db.execute(
+                "INSERT OR IGNORE INTO profile_views(profile_id, user_id) VALUES (?, ?)",
+                (profile_id, user_id)
+            )
+        self._sketch_add("profiles", profile_id, user_id)
+
+    def _sketch_add(self, kind, key, user_id):
+        if self.uniques == "exact":
+            return
+        sketch = self._sketches.get((kind, key))
+        if sketch is None:
+            sketch = self._sketches[(kind, key)] = HyperLogLog()
+        if sketch.add(user_id):
+            self._dirty_sketches.add((kind, key))
+
+    def _save_sketches(self):
+        if not self._dirty_sketches:
+            return
+        self.db.executemany(
+            "INSERT OR REPLACE INTO sketches(kind, key, registers) VALUES (?, ?, ?)",
+            ((kind, key, self._sketches[(kind, key)].to_bytes()) for kind, key in self._dirty_sketches)
+        )
+        self._dirty_sketches.clear()
+
+    def _apply_user_seen(self, user_id, user_tag):
+        if self.has_user(user_id):
+            # пользователь сменил @username
+            if self.get_username(user_id) != user_tag:
+                self._take_username(user_id, user_tag)
+            return
+
+        old_key = self._find_placeholder(user_tag)
+        if old_key is not None:
+            # переносим данные заглушки
+            self._merge_user(old_key, user_id)
+        else:
+            # новый юзер
+            self.db.execute("INSERT INTO users(user_id) VALUES (?)", (user_id,))
+        self._take_username(user_id, user_tag)
+
+    def _apply_delivery(self, state, user_ids, ts):
+        if state == "ok":
+            self.db.executemany(
+                "UPDATE users SET state = NULL, last_success = ? WHERE user_id = ?",
+                ((ts, uid) for uid in user_ids)
+            )
+        else:
+            self.db.executemany(
+                "UPDATE users SET state = ? WHERE user_id = ?",
+                ((state, uid) for uid in user_ids)
+            )
+
+    def _find_placeholder(self, user_tag):
+        row = self.db.execute(
+            "SELECT user_id FROM users WHERE username = ? AND user_id LIKE 'u%' LIMIT 1",
+            (user_tag,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _take_username(self, user_id, user_tag):
+        """Отдает @username пользователю user_id. Заглушки u<N> с этим ником —
+        тот же человек, они сливаются в user_id; у настоящих пользователей
+        ник просто устарел (Telegram отдает освободившиеся ники другим)"""
+        others = self.db.execute(
+            "SELECT user_id FROM users WHERE username = ? AND user_id != ?", (user_tag, user_id)
+        ).fetchall()
+        for (other,) in others:
+            if other.startswith("u"):
+                self.db.execute("DELETE FROM users WHERE user_id = ?", (other,))
+                self._move_views(other, user_id)
+            else:
+                self.db.execute("UPDATE users SET username = NULL WHERE user_id = ?", (other,))
+        self.db.execute("UPDATE users SET username = ? WHERE user_id = ?", (user_tag, user_id))
+
+    def _merge_user(self, old_key, user_id):
+        """Переносит запись пользователя и его просмотры профилей на новый id"""
+        self.db.execute("UPDATE users SET user_id = ? WHERE user_id = ?", (user_id, old_key))
+        self._move_views(old_key, user_id)
+
+    def _move_views(self, old_key, user_id):
+        self.db.execute("UPDATE OR IGNORE profile_views SET user_id = ? WHERE user_id = ?", (user_id, old_key))
+        self.db.execute("DELETE FROM profile_views WHERE user_id = ?", (old_key,))
+
+    # ----------------------------------------------------------------------
+    # чтение
+    # ----------------------------------------------------------------------
+
+    def has_user(self, user_id: str) -> bool:
+        return self.db.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def get_username(self, user_id: str) -> str | None:
+        row = self.db.execute("SELECT username FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def iter_users(self):
+        return self.db.execute("SELECT user_id, username FROM users")
+
+    def inactive_users(self):
+        return [r[0] for r in self.db.execute("SELECT user_id FROM users WHERE state IS NOT NULL")]
+
+    def get_users_id(self) -> list[str]:
+        rows = self.db.execute("SELECT user_id FROM users WHERE state IS NULL AND user_id NOT LIKE 'u%'")
+        return [r[0] for r in rows]
+
+    def _counters(self):
+        counters = dict(self.db.execute("SELECT name, value FROM counters ORDER BY rowid"))
+        counters["start_origin"] = dict(self.db.execute("SELECT origin, count FROM origins ORDER BY rowid"))
+        return counters
+
+    def resolve_audience(self, profiles=None, origin=None, active_since=None) -> list[str]:
+        query = "SELECT user_id FROM users WHERE state IS NULL AND user_id NOT LIKE 'u%'"
+        params = []
+        if origin is not None:
+            query += " AND origin = ?"
+            params.append(origin)
+        if active_since is not None:
+            query += " AND last_seen >= ?"
+            params.append(active_since // 86400 * 86400)
+        if profiles:
+            if not self.supports_profile_audience():
+                raise ValueError("Profile segments need exact viewer sets (uniques=exact|both)")
+            marks = ", ".join("?" * len(profiles))
+            query += (
+                " AND EXISTS (SELECT 1 FROM profile_views pv"
+                f" WHERE pv.user_id = users.user_id AND pv.profile_id IN ({marks}))"
+            )
+            params.extend(profiles)
+        return [r[0] for r in self.db.execute(query, params)]
+
+    def usage(self, series: str, unit: str, now: int) -> list[int]:
+        return rollup.ring_series(self._ring(series, unit), unit, now)
+
+    def _ring(self, series, unit):
+        rows = self.db.execute(
+            "SELECT slot, value FROM rollups WHERE series = ? AND unit = ? ORDER BY slot", (series, unit)
+        ).fetchall()
+        if not rows:
+            return None
+        # в ячейках могут остаться интервалы, давно вышедшие из окна
+        oldest = rows[-1][0] - rollup.UNITS[unit][1]
+        return {str(slot): value for slot, value in rows if slot > oldest}
+
+    def summary(self, top: int = 5) -> dict:
+        db = self.db
+        top_profiles = []
+        for pid, title, views in db.execute(
+            "SELECT profile_id, COALESCE(title, profile_id), views FROM profiles ORDER BY views DESC LIMIT ?",
+            (top,)
+        ).fetchall():
+            sketch = self._sketches.get(("profiles", pid))
+            if sketch is not None:
+                unique = sketch.count()
+            else:
+                unique = db.execute("SELECT COUNT(*) FROM profile_views WHERE profile_id = ?", (pid,)).fetchone()[0]
+            top_profiles.append((title, views, unique))
+        return {
+            "counters": self._counters(),
+            "users": db.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+            "inactive": db.execute("SELECT COUNT(*) FROM users WHERE state IS NOT NULL").fetchone()[0],
+            "top_profiles": top_profiles,
+            "origin_reach": {
+                key: sketch.count() for (kind, key), sketch in self._sketches.items() if kind == "origins"
+            },
+        }
+
+    def export(self) -> dict:
+        db = self.db
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        profiles = {}
+        for pid, title, views in db.execute("SELECT profile_id, title, views FROM profiles ORDER BY rowid"):
+            profiles[pid] = {"title": title, "users": [], "views": views}
+        if self.uniques != "sketch":
+            for pid, uid in db.execute("SELECT profile_id, user_id FROM profile_views"):
+                profiles.setdefault(pid, {"title": pid, "users": [], "views": 0})["users"].append(uid)
+        else:
+            for profile in profiles.values():
+                del profile["users"]
+        document = {
+            "meta": {
+                "created_at": meta.get("created_at"),
+                "last_updated": meta.get("last_updated"),
+            },
+            "counters": self._counters(),
+            "users": {
+                uid: _user_record(*row)
+                for uid, *row in db.execute(
+                    "SELECT user_id, username, origin, last_seen, state, last_success "
+                    "FROM users ORDER BY rowid"
+                )
+            },
+            "profiles": profiles,
+            "rollups": self._rollups(),
+        }
+        if self.uniques != "exact":
+            sketches = {"profiles": {}, "origins": {}}
+            for (kind, key), sketch in self._sketches.items():
+                sketches.setdefault(kind, {})[key] = sketch.to_str()
+            document["sketches"] = sketches
+        return document
+
+    def _rollups(self):
+        rollups = {}
+        for series, unit in self.db.execute("SELECT DISTINCT series, unit FROM rollups ORDER BY series"):
+            rollups.setdefault(unit, {})[series] = self._ring(series, unit)
+        return rollups
+
+
+def _user_record(username, origin, last_seen, state, last_success):
+    user = {"username": username}
+    if origin is not None:
+        user["origin"] = origin
+    if last_seen is not None:
+        user["last_seen"] = last_seen
+    if state is not None:
+        user["state"] = state
+    if last_success is not None:
+        user["last_success"] = last_success
+    return user
+
+
+class _Transaction:
+    """BEGIN/COMMIT вокруг блока (соединение работает в autocommit)"""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+        return False
@@ -0,0 +1,71 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+    - апдейты одного чата обрабатываются строго по очереди (нажатия
+      пользователя не обгоняют друг друга, ConversationHandler рассылки
+      видит шаги в правильном порядке);
+    - разные чаты обрабатываются одновременно, не более workers штук;
+    - нажатия кнопок (CallbackQuery) идут по отдельной полосе из
+      priority_workers мест, чтобы answer() не ждал текстовые сообщения
+      и прочую медленную работу;
+    - max_pending ограничивает число апдейтов, взятых из очереди
+      (включая ждущих своей очереди в чате), остальные ждут в update_queue.
+    """
+
+    __slots__ = ("_workers", "_priority", "_chat_locks")
+
+    def __init__(self, workers: int, priority_workers: int, max_pending: int):
+        super().__init__(max(max_pending, workers + priority_workers))
+        self._workers = asyncio.Semaphore(workers)
+        self._priority = asyncio.Semaphore(priority_workers) if priority_workers > 0 else None
+        # chat_id -> [lock, число апдейтов чата в обработке]
+        self._chat_locks: dict[int, list] = {}
+
+    async def do_process_update(self, update, coroutine):
+        metrics.count_update(update)
+        chat_id = _chat_id(update)
+        if chat_id is None:
+            async with self._lane(update):
+                await coroutine
+            return
+
+        entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # место в пуле занимаем только после своей очереди в чате,
+            # иначе один быстро кликающий пользователь займет весь пул
+            async with entry[0], self._lane(update):
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[chat_id]
+
+    def _lane(self, update):
+        if self._priority is not None and isinstance(update, Update) and update.callback_query:
+            return self._priority
+        return self._workers
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+def _chat_id(update):
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
@@ -1,3 +1,4 @@
+import bisect
 import datetime
 
 def build_description(profile):
@@ -49,46 +50,84 @@ def build_description(profile):
     return text
 
 
-def find_group_by_id(data, gid):
-    for g in data["groups"]:
-        if g["id"] == gid:
-            return g
-    return None
+# Москва живет в UTC+3 без перехода на летнее время
+MOSCOW_TZ = datetime.timezone(datetime.timedelta(hours=3), "MSK")
 
 
-def find_profile_by_id(data, pid):
-    for g in data["groups"]:
-        for p in g.get("profiles", []):
-            if p["id"] == pid:
-                return p, g
-    return None, None
+def moscow_today():
+    return datetime.datetime.now(MOSCOW_TZ).date()
 
 
-def get_top5_profiles(data):
-    """Возвращает топ-5 профилей по дате проведения"""
-    all_profiles = []
-    for group in data["groups"]:
-        for p in group.get("profiles", []):
-            # пропускаем профили без даты
-            if p.get("date_olimp", "") == "": continue
-            date_str = p["date_olimp"]
-            day, month, year = map(int, date_str.split("."))
-            date = datetime.date(year, month, day)
-            # пропускаем профили с прошедшей датой
-            if date < datetime.date.today(): continue
-            all_profiles.append(p) # (p, group)
-    
-    # функция извлечения даты для сортировки
-    def extract_date(profile):
-        date_str = profile["date_olimp"]
+def parse_olimp_date(date_str):
+    """'дд.мм.гггг' -> date или None, если даты нет или она некорректна"""
+    try:
         day, month, year = map(int, date_str.split("."))
+        return datetime.date(year, month, day)
+    except (ValueError, AttributeError):
+        return None
 
-        #проверка, если дата уже прошла, то не учитывать её
-        date = datetime.date(year, month, day)
-        if date < datetime.date.today():
-            return (9999, 12, 31)
-        return (year, month, day)
-    
-    all_profiles.sort(key=extract_date)
-    top5_profiles = all_profiles[:5]
-    return top5_profiles
\ No newline at end of file
+
+class UpcomingProfiles:
+    """Профили, отсортированные по дате проведения олимпиады.
+
+    Даты разбираются один раз при загрузке каталога. Позиция первой
+    непрошедшей даты сдвигается при смене дня (по Москве), поэтому
+    выборка ближайших n профилей — это просто срез.
+    """
+
+    __slots__ = ("_dates", "_profiles", "_pos", "_today")
+
+    def __init__(self, profiles):
+        items = []
+        for p in profiles:
+            date = parse_olimp_date(p.get("date_olimp", ""))
+            # пропускаем профили без даты
+            if date is not None:
+                items.append((date, p))
+        items.sort(key=lambda x: x[0])
+        self._dates = [d for d, _ in items]
+        self._profiles = [p for _, p in items]
+        self._pos = 0
+        self._today = None
+        self.advance()
+
+    def advance(self, today=None):
+        """Пропускает прошедшие даты. Возвращает True, если выборка изменилась"""
+        today = today or moscow_today()
+        if today == self._today:
+            return False
+        self._today = today
+        pos = bisect.bisect_left(self._dates, today)
+        changed = pos != self._pos
+        self._pos = pos
+        return changed
+
+    def next(self, n=5):
+        """Ближайшие n профилей с непрошедшей датой"""
+        self.advance()
+        return self._profiles[self._pos:self._pos + n]
+
+
+def build_close_dates_text(profiles):
+    """Возвращает текст экрана ближайших олимпиад"""
+    profiles_text = ""
+    for i, profile in enumerate(profiles):
+        name = profile['name']
+        date = profile['date_olimp']
+        profiles_text += f"{i+1}. *{name}* — {date}\n"
+    return f"Здесь собраны топ-5 ближайших олимпиад по разным направлениям.\n\n{profiles_text}\n\nВыбери интересующую: "
+
+
+def build_group_text(group):
+    """Возвращает текст экрана выбора профиля в группе"""
+    return f"Группа *{group['name']}*.\n\n{group.get('description','')}\n\nТеперь выбери профиль:"
+
+
+_SPARK = "▁▂▃▄▅▆▇█"
+
+def sparkline(values):
+    """Мини-график ряда чисел одной строкой"""
+    top = max(values, default=0)
+    if not top:
+        return _SPARK[0] * len(values)
+    return "".join(_SPARK[round(v * (len(_SPARK) - 1) / top)] for v in values)
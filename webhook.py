@@ -0,0 +1,47 @@
+import json
+import hmac
+from logger import logger
+
+from telegram import Update
+
+import config
+from http_server import HttpServer
+
+_SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def setup_webhook(app, server: HttpServer):
+    """Регистрирует на server путь config.WEBHOOK_PATH, который кладет
+    апдейты Telegram в app.update_queue (дальше — как при polling)"""
+    record = open(config.WEBHOOK_RECORD, "ab") if config.WEBHOOK_RECORD else None
+
+    async def handle_update(request):
+        token = request.headers.get(_SECRET_HEADER, "")
+        if not config.WEBHOOK_SECRET or not hmac.compare_digest(token, config.WEBHOOK_SECRET):
+            return 403, "text/plain", b"Forbidden"
+        try:
+            update = Update.de_json(json.loads(request.body), app.bot)
+        except Exception as e:
+            logger.warning(f"Bad webhook payload: {e}")
+            return 400, "text/plain", b"Bad Request"
+
+        if record is not None:
+            # запись апдейтов для scripts/replay_updates.py
+            record.write(request.body.replace(b"\n", b"") + b"\n")
+            record.flush()
+        await app.update_queue.put(update)
+        return 200, "text/plain", b"OK"
+
+    server.route("POST", config.WEBHOOK_PATH, handle_update)
+
+async def set_webhook(bot):
+    """Сообщает Telegram адрес вебхука. TLS завершается на прокси/балансировщике,
+    сам сервер слушает обычный HTTP на config.WEBHOOK_LISTEN:WEBHOOK_PORT"""
+    url = config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH
+    await bot.set_webhook(
+        url=url,
+        secret_token=config.WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"Webhook set to {url}")